@@ -0,0 +1,139 @@
+"""
+Band limited candidate pairs for time matching. Both sides are sorted once and only
+the pairs closer than the tolerance are emitted, so memory scales with the number of
+near coincidences rather than with the product of the two lengths.
+
+i.e.)
+    pairs = band_pairs(egg_times, pitch_times, 2e-4)
+    rows, cols, dists = pairs.coo()
+"""
+
+import sys
+
+import numpy as np
+
+class CandidatePairs():
+    """
+        Summary: The pairs (time, reference time) closer than a tolerance in compressed rows.
+                    Row i holds the reference times paired with times[i] in order of
+                    increasing reference time.
+
+        Attributes:
+            offsets: Row i is entries offsets[i]:offsets[i + 1]
+            indices: The reference index of every entry
+            distances: The absolute time difference of every entry
+            shape: (number of times, number of reference times)
+    """
+    def __init__(self, offsets, indices, distances, shape):
+        self.offsets = offsets
+        self.indices = indices
+        self.distances = distances
+        self.shape = shape
+
+    def __len__(self):
+        return self.indices.size
+
+    # Returns the row (time index) of every entry
+    def rows(self):
+        return np.repeat(np.arange(self.shape[0], dtype=np.intp), np.diff(self.offsets))
+
+    # Returns (rows, cols, distances) in coordinate form
+    def coo(self):
+        return (self.rows(), self.indices, self.distances)
+
+    # Returns the number of candidates of every row
+    def counts(self):
+        return np.diff(self.offsets)
+
+"""
+Finds every pair of times closer than the tolerance
+    times: One dimensional array-like of times (i.e. egg times)
+    ref_times: One dimensional array-like of reference times (i.e. pitch times)
+    tol: Largest time difference (s) of a pair (exclusive)
+
+    Returns: A CandidatePairs object
+"""
+def band_pairs(times, ref_times, tol):
+    times = np.asarray(times, dtype=float)
+    ref_times = np.asarray(ref_times, dtype=float)
+
+    if times.ndim != 1 or ref_times.ndim != 1:
+        sys.exit('Band Pairs Error: times and ref_times must be one dimensional.')
+
+    # Stable sort so that equal reference times keep their index order
+    order = np.argsort(ref_times, kind='mergesort')
+    ref_sorted = ref_times[order]
+
+    # The window of every time (inclusive here, trimmed to the exact tolerance below)
+    lo = np.searchsorted(ref_sorted, times - tol, side='left')
+    hi = np.searchsorted(ref_sorted, times + tol, side='right')
+    counts = hi - lo
+
+    rows = np.repeat(np.arange(times.size, dtype=np.intp), counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if counts.size else counts
+    cols = np.arange(rows.size, dtype=np.intp) - np.repeat(starts - lo, counts)
+
+    distances = np.abs(ref_sorted[cols] - times[rows])
+    within = distances < tol
+
+    rows = rows[within]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=times.size)))).astype(np.intp)
+
+    return CandidatePairs(offsets, order[cols[within]], distances[within], (times.size, ref_times.size))
+
+"""
+Assigns times to reference times one to one so that as many pairs as possible are
+matched and, among those assignments, the total time difference is smallest. The pairs
+form a sparse bipartite graph which is split into connected components and every
+component is solved on its own (a component of a single pair is matched directly).
+Needs scipy.
+    pairs: A CandidatePairs object (i.e. from band_pairs)
+
+    Returns: (time_indices, ref_indices) as numpy integer arrays ordered by time index
+"""
+def optimal_pairs(pairs):
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    rows, cols, distances = pairs.coo()
+    if rows.size == 0:
+        return (np.array([], dtype=np.intp), np.array([], dtype=np.intp))
+
+    # Times are nodes 0:n and reference times follow them
+    n = sum(pairs.shape)
+    graph = coo_matrix((np.ones(rows.size), (rows, cols + pairs.shape[0])), shape=(n, n))
+    __, labels = connected_components(graph, directed=False)
+
+    order = np.argsort(labels[rows], kind='mergesort')
+    bounds = np.flatnonzero(np.diff(labels[rows][order])) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [order.size]))
+
+    single = (ends - starts) == 1
+    time_indices = [rows[order[starts[single]]]]
+    ref_indices = [cols[order[starts[single]]]]
+
+    for beg, end in zip(starts[~single], ends[~single]):
+        entries = order[beg:end]
+        comp_rows, row_inv = np.unique(rows[entries], return_inverse=True)
+        comp_cols, col_inv = np.unique(cols[entries], return_inverse=True)
+
+        # Missing pairs cost more than every real pair combined so the number
+        # of real pairs is maximized before their total difference is minimized
+        missing = distances[entries].sum() + 1.0
+        cost = np.full((comp_rows.size, comp_cols.size), missing)
+        cost[row_inv, col_inv] = distances[entries]
+
+        row_ind, col_ind = linear_sum_assignment(cost)
+        real = cost[row_ind, col_ind] < missing
+
+        time_indices.append(comp_rows[row_ind[real]])
+        ref_indices.append(comp_cols[col_ind[real]])
+
+    time_indices = np.concatenate(time_indices)
+    ref_indices = np.concatenate(ref_indices)
+
+    order = np.argsort(time_indices, kind='mergesort')
+
+    return (time_indices[order], ref_indices[order])
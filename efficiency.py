@@ -0,0 +1,106 @@
+"""
+Katydid detection efficiency computed from file metadata only. The number of
+detected events of a seed is the length of its candidates dataset (no rows are
+read) and the number of simulated events is the number of non-empty lines in its
+pitch angle file (counted without splitting or converting any values). Seeds are counted concurrently.
+"""
+
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
+import h5py as h5
+import numpy as np
+import pandas as pd
+
+from process import index_seeds
+
+# Returns the number of rows in the group/dataset of an hdf5 file from its shape
+# or -1 if the dataset does not exist or the file cannot be read
+def count_candidates(fn, group="candidates", dataset="candidates_0"):
+    try:
+        with h5.File(fn, 'r') as hf:
+            ds = hf.get(group + '/' + dataset)
+
+            if not isinstance(ds, h5.Dataset):
+                sys.stderr.write("'{}' has no dataset: {}/{}.\n".format(fn, group, dataset))
+                return -1
+
+            return ds.shape[0] if ds.shape else 1
+    except OSError:
+        sys.stderr.write("'{}' is not a readable hdf5 file.\n".format(fn))
+        return -1
+
+# Returns the number of (time, pitch angle) rows in a pitch angle file,
+# one per non-empty line
+def count_pitch_rows(fn):
+    with open(fn, 'rb') as f:
+        return sum(1 for line in f if line.strip())
+
+# Returns the (lower, upper) Wilson score interval of k successes in n trials.
+# Works element-wise on arrays and gives nan where n is 0.
+def wilson_interval(k, n, confidence=0.95):
+    k = np.asarray(k, dtype=float)
+    n = np.asarray(n, dtype=float)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = k / n
+        center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+        half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+
+    return (center - half, center + half)
+
+"""
+Computes the detection efficiency of every seed found in both directories.
+    h5_dir [default: "./data/processed_eggs/hdf5"]
+    pitch_dir [default: "./data/pitch_angles"]
+    workers [default: 8]: The number of threads counting seeds concurrently
+    confidence [default: 0.95]: The confidence level of the binomial intervals
+
+    Returns: (table, total)
+        table: A pandas DataFrame with one row per seed and the columns seed, simulated,
+            detected, fraction, lower and upper (the Wilson interval of fraction)
+        total: A dictionary with the same keys for all seeds combined
+"""
+def detection_efficiency(h5_dir=None, pitch_dir=None, workers=8, confidence=0.95):
+    if h5_dir is None:
+        h5_dir = "./data/processed_eggs/hdf5"
+
+    if pitch_dir is None:
+        pitch_dir = "./data/pitch_angles"
+
+    index = index_seeds(h5_dir=h5_dir, pitch_dir=pitch_dir)
+    seeds = [seed for seed, fns in index.items() if 'h5' in fns and 'pitch' in fns]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        detected = list(pool.map(count_candidates, [index[seed]['h5'] for seed in seeds]))
+        simulated = list(pool.map(count_pitch_rows, [index[seed]['pitch'] for seed in seeds]))
+
+    table = pd.DataFrame({'seed': seeds,
+                          'simulated': np.array(simulated, dtype=np.int64),
+                          'detected': np.array(detected, dtype=np.int64)})
+
+    # Seeds whose candidates could not be found are reported but left out of the total
+    table = table[table['detected'] >= 0].reset_index(drop=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table['fraction'] = table['detected'] / table['simulated']
+    table['lower'], table['upper'] = wilson_interval(table['detected'], table['simulated'], confidence)
+
+    total = {'seed': 'Total',
+             'simulated': int(table['simulated'].sum()),
+             'detected': int(table['detected'].sum())}
+    total['fraction'] = total['detected'] / total['simulated'] if total['simulated'] else np.nan
+    total['lower'], total['upper'] = (float(bound) for bound in wilson_interval(total['detected'], total['simulated'], confidence))
+
+    return (table, total)
+
+# Prints the per seed table and the total in the same form as test_event_processing
+def print_efficiency(table, total):
+    for row in table.itertuples():
+        print("{}: {}/{} events detected ({}%).".format(row.seed, row.detected, row.simulated, row.fraction * 100))
+
+    print("Total Events Detected: {}/{} ({}%) [{:.2f}%, {:.2f}%]".format(
+        total['detected'], total['simulated'], total['fraction'] * 100, total['lower'] * 100, total['upper'] * 100))
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
-from process import test_event_processing
+from efficiency import detection_efficiency, print_efficiency
 
-test_event_processing()
+table, total = detection_efficiency()
+print_efficiency(table, total)
@@ -0,0 +1,247 @@
+import sys
+import threading
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+import h5py as h5
+import numpy as np
+
+from seedcache import fingerprint
+
+class FilePool():
+    """
+        Summary: A small least recently used pool of open read-only h5py.File handles so
+                    repeated reads from the same seed file do not reopen it every time. A
+                    handle is reopened when the file's fingerprint no longer matches the one
+                    it was opened with (the file was rewritten).
+
+        Attributes:
+            max_open: The largest number of files kept open at once. The least recently
+                        used handle is closed when another file has to be opened.
+            handles: An OrderedDict of file name -> (fingerprint, open h5py.File object)
+    """
+    def __init__(self, max_open=8):
+        if max_open < 1:
+            sys.exit('FilePool Error: max_open must be at least 1.')
+
+        self.max_open = max_open
+        self.handles = OrderedDict()
+        self._lock = threading.RLock()
+
+    # Returns an open handle for the file, opening (and evicting) as needed
+    #   fp [default: None]: The fingerprint of the file if the caller already has it
+    def get(self, fn, fp=None):
+        if fp is None:
+            fp = fingerprint(fn)
+
+        with self._lock:
+            opened, hf = self.handles.get(fn, (None, None))
+
+            if hf is not None and hf.id.valid and opened == fp:
+                self.handles.move_to_end(fn)
+                return hf
+
+            if hf is not None:
+                del self.handles[fn]
+                hf.close()
+
+            while len(self.handles) >= self.max_open:
+                __, (__, old) = self.handles.popitem(last=False)
+                old.close()
+
+            hf = h5.File(fn, 'r')
+            self.handles[fn] = (fp, hf)
+
+            return hf
+
+    # Close every handle in the pool
+    def close(self):
+        with self._lock:
+            while self.handles:
+                __, (__, hf) = self.handles.popitem()
+                hf.close()
+
+class DatasetCache():
+    """
+        Summary: A least recently used memo of datasets read from disk which is bounded by
+                    the total number of bytes held rather than the number of entries.
+
+        Attributes:
+            max_bytes: The most bytes of dataset memory to hold. A single dataset larger than
+                        this is returned to the caller but never stored.
+            nbytes: The number of bytes currently held
+            entries: An OrderedDict of (file name, fingerprint, dataset path) -> numpy array.
+                        Entries of a file which has since changed are never looked up again
+                        and age out.
+    """
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        with self._lock:
+            value = self.entries.get(key)
+
+            if value is not None:
+                self.entries.move_to_end(key)
+
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if value.nbytes > self.max_bytes:
+                return
+
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+
+            while self.entries and self.nbytes + value.nbytes > self.max_bytes:
+                __, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+            self.entries[key] = value
+            self.nbytes += value.nbytes
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+# Shared by every lazy group in the process. Only file names and paths are kept on
+# the groups themselves so they pickle cleanly and reopen files wherever they land.
+_pool = FilePool()
+_cache = DatasetCache()
+
+# Changes the size of the shared file pool and dataset cache. Open handles and cached
+# datasets are dropped.
+def configure(max_open=None, max_bytes=None):
+    global _pool, _cache
+
+    if max_open is not None:
+        _pool.close()
+        _pool = FilePool(max_open)
+
+    if max_bytes is not None:
+        _cache.clear()
+        _cache = DatasetCache(max_bytes)
+
+# Closes every pooled file handle (they are reopened on the next read)
+def close_files():
+    _pool.close()
+
+# Closes every pooled file handle and empties the dataset cache
+def close():
+    close_files()
+    _cache.clear()
+
+class LazyGroup(MutableMapping):
+    """
+        Summary: A dictionary-like view of a group in an hdf5 file. Subgroups are returned as
+                    LazyGroup objects and datasets are read into numpy arrays the first time
+                    they are accessed (then served from the shared DatasetCache).
+
+                    Values assigned to the group (i.e. filtered datasets or pitch angle data)
+                    are kept in memory and never written to the file. Arrays returned from the
+                    file may be shared with the cache and should not be modified in place.
+
+        Attributes:
+            filename: The hdf5 file the group lives in
+            path: The path of the group inside the file ('/' for the file itself)
+    """
+    def __init__(self, filename, path='/'):
+        self.filename = filename
+        self.path = path
+
+        self._members = None      # name -> True for groups, False for datasets
+        self._local = dict()      # values assigned in memory
+        self._deleted = set()     # file members hidden by a delete
+
+    def _member_path(self, name):
+        return self.path.rstrip('/') + '/' + name
+
+    # Learn the names and kinds of the members without reading any data
+    def _load_members(self):
+        if self._members is None:
+            grp = _pool.get(self.filename)[self.path]
+
+            members = dict()
+            for name in grp:
+                link = grp.get(name, getclass=True)
+                if link is h5.Group or link is h5.Dataset:
+                    members[name] = link is h5.Group
+
+            self._members = members
+
+        return self._members
+
+    def _read(self, name):
+        fp = fingerprint(self.filename)
+        key = (self.filename, fp, self._member_path(name))
+
+        value = _cache.get(key)
+        if value is None:
+            ds = _pool.get(self.filename, fp)[key[2]]
+            value = np.asarray(ds[()])
+            _cache.put(key, value)
+
+        return value
+
+    def __getitem__(self, name):
+        if name in self._local:
+            return self._local[name]
+
+        members = self._load_members()
+        if name in self._deleted or name not in members:
+            raise KeyError(name)
+
+        if members[name]:
+            group = LazyGroup(self.filename, self._member_path(name))
+            self._local[name] = group
+            return group
+
+        return self._read(name)
+
+    def __setitem__(self, name, value):
+        self._deleted.discard(name)
+        self._local[name] = value
+
+    def __delitem__(self, name):
+        found = self._local.pop(name, None) is not None
+        if name in self._load_members() and name not in self._deleted:
+            self._deleted.add(name)
+            found = True
+
+        if not found:
+            raise KeyError(name)
+
+    def __iter__(self):
+        names = [name for name in self._load_members() if name not in self._deleted]
+        names += [name for name in self._local if name not in self._members]
+
+        return iter(names)
+
+    def __len__(self):
+        return sum(1 for __ in self)
+
+    def __contains__(self, name):
+        if name in self._local:
+            return True
+
+        return name in self._load_members() and name not in self._deleted
+
+    def __repr__(self):
+        return "<LazyGroup '{}' in '{}' ({} members)>".format(self.path, self.filename, len(self))
+
+    # Reads everything below this group into plain dictionaries of numpy arrays
+    def todict(self):
+        h5dict = dict()
+        for name, value in self.items():
+            if isinstance(value, LazyGroup):
+                value = value.todict()
+            h5dict[name] = value
+
+        return h5dict
@@ -7,24 +7,35 @@ Author: L. Saldana
 
 from __future__ import division
 from __future__ import absolute_import
+from __future__ import print_function
 
 import os
 import sys
 import glob
+import json
 import subprocess
+import multiprocessing
 import numpy as np
 import matplotlib as mpl
 mpl.use('pdf')
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import ListedColormap
 mpl.rcParams['figure.figsize'] = (12,6) # figsize
 mpl.rcParams['font.size'] = 15 # tick size
 mpl.rcParams['axes.labelsize'] = 20 # axes label size
 mpl.rcParams['axes.titlesize'] = 20 # title size
 
-from itertools import izip
+import rootcache
+
+# Layout of the discriminated points, tracks and events in h5 files (group, dataset, fields)
+# The fields are named after the ROOT leaves without their leading 'f' (the same layout as the root sidecars)
+H5_DISCRIM = rootcache.DISCRIM
+H5_TRACKS = rootcache.TRACKS
+H5_EVENTS = rootcache.EVENTS
 
 def plotSparseSpec(discrim_time,discrim_freq,spec_name,file_dest_dir=None,tracklabels_inrun=np.array([]),tracktimes_inrun=np.array([]),
-                   trackfreqs_inrun=np.array([]),evtstarttimes_inrun=np.array([]),evtstartfreqs_inrun=np.array([]),flag_classified=False):
+                   trackfreqs_inrun=np.array([]),evtstarttimes_inrun=np.array([]),evtstartfreqs_inrun=np.array([]),flag_classified=False,raster_bins=None):
     u'''
     Plots (and saves) sparse spectrograms given the discriminated points in time and frequency; it can also overlay tracks and events
     By discriminated points we mean the values of the Katydid signal `discrim:disc-1d`. Usually we would have root or h5 files with this
@@ -42,6 +53,8 @@ def plotSparseSpec(discrim_time,discrim_freq,spec_name,file_dest_dir=None,trackl
     evtstarttimes_inrun (1d arr): numpy array of events' start times in seconds
     evtstartfreqs_inrun (1d arr): numpy array of events' start frequencies in Hz
     flag_classified (bool): True if plotting tracks which have been classified; used with processSparseSpec2() only
+    raster_bins (int or tuple): if given the discriminated points are binned into a (time bins, frequency bins) raster and drawn as a
+        single density image instead of one marker per point; tracks and events are still drawn as vectors on top
     '''
 
     handles = [] # for legend
@@ -53,7 +66,15 @@ def plotSparseSpec(discrim_time,discrim_freq,spec_name,file_dest_dir=None,trackl
     # Plot discriminated points
     fig = plt.figure(figsize=(14,10))
     plt.clf()
-    plt.scatter(discrim_time*1e3,(discrim_freq+min_freq)/1e6,s=7,color=u'k',alpha=0.4,lw=0.2,zorder=2) # discrim points
+    if raster_bins is None:
+        plt.scatter(discrim_time*1e3,(discrim_freq+min_freq)/1e6,s=7,color=u'k',alpha=0.4,lw=0.2,zorder=2) # discrim points
+    else:
+        # Density of discrim points (empty bins left blank) below the tracks and events
+        extent = [np.min(discrim_time)*1e3,np.max(discrim_time)*1e3,np.min(discrim_freq+min_freq)/1e6,np.max(discrim_freq+min_freq)/1e6]
+        raster = np.histogram2d(discrim_time*1e3,(discrim_freq+min_freq)/1e6,bins=raster_bins,range=[extent[:2],extent[2:]])[0]
+        # Greys from mid grey up and a scale starting at 0 so a bin holding a single point is as visible as a scatter marker
+        cmap = ListedColormap(plt.get_cmap(u'Greys')(np.linspace(0.4,1,256)))
+        plt.imshow(np.ma.masked_equal(raster.T,0),origin=u'lower',extent=extent,aspect=u'auto',interpolation=u'nearest',cmap=cmap,vmin=0,zorder=0)
     plt.xlim(np.min(discrim_time)*1e3,np.max(discrim_time)*1e3)
     plt.ylim(np.min(discrim_freq+min_freq)/1e6,np.max(discrim_freq+min_freq)/1e6)
     plt.xticks(fontsize=12)
@@ -65,13 +86,9 @@ def plotSparseSpec(discrim_time,discrim_freq,spec_name,file_dest_dir=None,trackl
     # If the track (no classification label) info is present we plot it on top
     if tracktimes_inrun.size:
         spec_name += u"+Tracks"
-        counter = 0
-        for idx_track in xrange(len(tracktimes_inrun)): # there might be more than one track within the acquisition
-            if counter != 0:
-                plt.plot(tracktimes_inrun[idx_track]*1e3,trackfreqs_inrun[idx_track]/1e6,linewidth=4,color='red',zorder=1)
-            else:
-                plt.plot(tracktimes_inrun[idx_track]*1e3,trackfreqs_inrun[idx_track]/1e6,linewidth=4,color='red',zorder=1,label='Track')
-                counter += 1
+        # All the tracks within the acquisition as one collection of (start, end) segments
+        segments = np.stack((tracktimes_inrun*1e3,trackfreqs_inrun/1e6),axis=2)
+        plt.gca().add_collection(LineCollection(segments,linewidths=4,colors='red',zorder=1,label='Track'))
 
     # If the event info is present we plot it on top
     if evtstarttimes_inrun.size:
@@ -84,145 +101,334 @@ def plotSparseSpec(discrim_time,discrim_freq,spec_name,file_dest_dir=None,trackl
         plt.title(spec_name,fontsize=18)
         file_dest = file_dest_dir + u"/" + spec_name + u".png"
         plt.savefig(file_dest,dpi=300,bbox_inches=u'tight')
-        print u'\t\t{}'.format(spec_name)+u'.png'
+        print(u'\t\t{}'.format(spec_name)+u'.png')
         plt.close()
 
-    return
+        return file_dest
+
+    return None
+
+def plotSparseSpecJob(kwargs):
+    u'''
+    Calls plotSparseSpec() with a dictionary of its arguments (discrim_time and discrim_freq included) and closes every figure
+    afterwards; used by processSparseSpecFile() to render its acquisitions one after another
+    Returns the path of the saved png file or None
+    '''
+
+    file_dest = plotSparseSpec(**kwargs)
+    plt.close(u'all')
+
+    return file_dest
+
+# Name of the sidecar manifest processSparseSpec() keeps in the destination directory
+RENDER_MANIFEST = u'.sparse_spec_manifest.json'
+
+def loadRenderManifest(file_dest_dir):
+    u'''
+    Loads the render manifest of a destination directory: a dictionary keyed by source file path of
+    {fingerprint: [mtime_ns, size] of the source file, params: render parameters, outputs: names of the png files written}
+    Returns an empty dictionary if there is no (readable) manifest
+    '''
+
+    try:
+        with open(os.path.join(file_dest_dir,RENDER_MANIFEST)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def saveRenderManifest(file_dest_dir,manifest):
+    u'''
+    Writes the render manifest of a destination directory (next to it first, so it is never left half written)
+    '''
+
+    file_dest = os.path.join(file_dest_dir,RENDER_MANIFEST)
+    with open(file_dest+u'.tmp',u'w') as f:
+        json.dump(manifest,f,indent=1,sort_keys=True)
+    os.replace(file_dest+u'.tmp',file_dest)
+
+def renderEntry(file_name,params):
+    u'''
+    Returns the manifest entry (without outputs) for a source file rendered with the given parameters
+    '''
+
+    from seedcache import fingerprint # the same fingerprint as every other cache of the source files
+
+    # Round trip through json so entries compare equal to those loaded from the manifest
+    return json.loads(json.dumps({u'fingerprint':list(fingerprint(file_name)),u'params':params}))
+
+def isUpToDate(entry,recorded,file_dest_dir):
+    u'''
+    True if a source file was already rendered from the same contents with the same parameters and all its png files still exist
+    '''
+
+    if recorded is None or u'outputs' not in recorded:
+        return False
+
+    if recorded[u'fingerprint'] != entry[u'fingerprint'] or recorded[u'params'] != entry[u'params']:
+        return False
+
+    return all(os.path.isfile(os.path.join(file_dest_dir,output)) for output in recorded[u'outputs'])
+
+def loadSparseSpecRoot(file_name,flag_plot_tracks=False,flag_plot_evts=False):
+    u'''
+    Loads the discriminated points and optionally the tracks and events of a Katydid root file from its hdf5 sidecar (see rootcache.py)
+    The sidecar is converted first with ROOT if it is missing or stale, otherwise ROOT is never imported
+    Required:
+    file_name (str): path to the root file
+    Optional:
+    flag_plot_tracks (bool): if True then the tracks are loaded
+    flag_plot_evts (bool): if True then the events are loaded
+    Returns None if the file has no discriminated points, else a tuple (time, freq, tracktimes, trackfreqs, evtstarttimes, evtstartfreqs)
+    where the track and event arrays are None when not loaded (shapes as in plotSparseSpec)
+    '''
+
+    # A stale or missing sidecar is converted first so the root file is only ever read by rootcache.convert_root()
+    sidecar = rootcache.convert_root(file_name)
+    if sidecar is None:
+        print(u"\tNo discPoints1D data found. Skipping...")
+        return None # without discrim points we don't care for tracks/events
 
-def processSparseSpec(file_loc,file_type=u'root',file_dest_dir=None,acq_length=0.02,flag_plot_tracks=False,flag_plot_evts=False):
+    return loadSparseSpecH5(sidecar,flag_plot_tracks=flag_plot_tracks,flag_plot_evts=flag_plot_evts)
+
+def readH5Fields(h5_file,layout):
     u'''
-    Processes a directory where root or h5 (not yet implemented) files sit which have sparse spectrogram data and optionally track and event data
+    Reads the fields of a compound dataset of an open h5 file in a single read (see H5_DISCRIM, H5_TRACKS and H5_EVENTS)
+    Required:
+    h5_file (h5py.File): the open h5 file
+    layout (tuple): (group, dataset, fields)
+    Returns a dictionary of 1d numpy arrays keyed by field or None if the dataset or any of the fields are missing
+    '''
+
+    group, dataset, fields = layout
+    ds = h5_file.get(group+u'/'+dataset)
+    if ds is None or ds.dtype.names is None or not set(fields).issubset(ds.dtype.names):
+        return None
+
+    values = ds.fields(fields)[()] if ds.shape else ds.fields(fields)[()][None]
+    return dict((field, np.ascontiguousarray(values[field],dtype=float)) for field in fields)
+
+def loadSparseSpecH5(file_name,flag_plot_tracks=False,flag_plot_evts=False):
+    u'''
+    Loads the discriminated points and optionally the tracks and events of an h5 file with one bulk read per dataset
+    The datasets must follow the H5_DISCRIM, H5_TRACKS and H5_EVENTS layouts
+    Required:
+    file_name (str): path to the h5 file
+    Optional:
+    flag_plot_tracks (bool): if True then the tracks are loaded
+    flag_plot_evts (bool): if True then the events are loaded
+    Returns the same as loadSparseSpecRoot()
+    '''
+
+    import h5py # only need h5py for this function
+
+    tracktimes = trackfreqs = evtstarttimes = evtstartfreqs = None
+
+    with h5py.File(file_name,u'r') as h5_file:
+        print('ii_file: {}'.format(file_name))
+
+        disc = readH5Fields(h5_file,H5_DISCRIM)
+        if disc is None:
+            print(u"\tNo discPoints1D data found. Skipping...")
+            return None # without discrim points we don't care for tracks/events
+
+        time, freq = disc[u'TimeInRunC'], disc[u'Abscissa']
+
+        if flag_plot_tracks:
+            tracks = readH5Fields(h5_file,H5_TRACKS)
+            if tracks is None:
+                print(u'\tNo tracks data found. Skipping...')
+                return None
+
+            tracktimes = np.column_stack((tracks[u'StartTimeInRunC'],tracks[u'EndTimeInRunC']))
+            trackfreqs = np.column_stack((tracks[u'StartFrequency'],tracks[u'EndFrequency']))
+
+        if flag_plot_evts:
+            events = readH5Fields(h5_file,H5_EVENTS)
+            if events is None:
+                print(u'\tNo events data found. Skipping...')
+                events = {u'StartTimeInRunC':np.array([]),u'StartFrequency':np.array([])}
+
+            evtstarttimes, evtstartfreqs = events[u'StartTimeInRunC'], events[u'StartFrequency']
+
+    return (time, freq, tracktimes, trackfreqs, evtstarttimes, evtstartfreqs)
+
+def acquisitionIndex(time,acq_length,tracktimes=None,evtstarttimes=None):
+    u'''
+    Splits a run into its acquisitions with one sort per array. Data files (h5/root) come from concatenated mat files and thus have
+    huge time gaps, an acquisition ends at every gap (> 0.1 s) and at the last point and starts acq_length before its end
+    Required:
+    time (1d arr): numpy array of discriminated points' times in seconds
+    acq_length (double): acquisition length of data
+    Optional:
+    tracktimes (2d arr of shape Nx2): numpy array where each row is [start_time,end_time] in seconds
+    evtstarttimes (1d arr): numpy array of events' start times in seconds
+    Returns a dictionary with
+    'upperlims' (1d arr): the end time of every acquisition
+    'points', 'tracks' and 'events': tuples (order, starts, ends) where order sorts the array by (start) time and rows starts[k]:ends[k]
+    of the sorted array start within acquisition k (tracks may still end after it); 'tracks' and 'events' only when given
+    '''
+
+    index = {}
+
+    order = np.argsort(time,kind=u'mergesort')
+    time_sorted = time[order]
+    time_diff = np.diff(time_sorted) # misses the last time limit
+    time_upperlim = time_sorted[np.where(time_diff>0.1)[0]]
+    time_upperlim = np.append(time_upperlim,time_sorted[-1]) # include the last time limit
+    time_lowerlim = time_upperlim-acq_length
+
+    index[u'upperlims'] = time_upperlim
+    index[u'points'] = (order,np.searchsorted(time_sorted,time_lowerlim,side=u'left'),np.searchsorted(time_sorted,time_upperlim,side=u'right'))
+
+    for key, times in ((u'tracks',None if tracktimes is None else tracktimes[:,0]),(u'events',evtstarttimes)):
+        if times is None:
+            continue
+
+        order = np.argsort(times,kind=u'mergesort')
+        times_sorted = times[order]
+        index[key] = (order,np.searchsorted(times_sorted,time_lowerlim,side=u'left'),np.searchsorted(times_sorted,time_upperlim,side=u'right'))
+
+    return index
+
+def processSparseSpec(file_loc,file_type=u'root',file_dest_dir=None,acq_length=0.02,flag_plot_tracks=False,flag_plot_evts=False,raster_bins=None,
+                      workers=None,flag_force=False):
+    u'''
+    Processes a directory where root or h5 files sit which have sparse spectrogram data and optionally track and event data
     The files must at least contain discriminated-points data to make plots. Plots can be saved if a destination directory is provided
     By discriminated points we mean the values of the Katydid signal `discrim:disc-1d`
 
     Required:
-    file_loc (str): path to directory where source root or h5 (not yet implemented) files sit; no final forwardslash /
-    file_type (str) root or h5 (not yet implemented)
+    file_loc (str): path to directory where source root or h5 files sit; no final forwardslash /
+    file_type (str) root or h5 (h5 files are read with h5py, see loadSparseSpecH5(), and need no ROOT install)
 
     Optional:
     file_dest_dir (str): path to directory to save plots as png files to; no final forwardslash /
     acq_length (double): acquisition length of data. Defaults to 10 ms which is our usual acquisition length
     flag_plot_tracks (bool): if True then we plot tracks on top of sparse spectrogram
     flag_plot_evts (bool): if True then we plit events on top of sparse spectrogram
+    raster_bins (int or tuple): if given the discriminated points are drawn as a density raster (see plotSparseSpec())
+    workers (int): number of processes the files are rendered in (one file per task); None uses every core and 1 renders in this process
+    flag_force (bool): if True every file is rendered again. Otherwise files whose contents and render parameters have not changed since
+        their images were saved (as recorded in the RENDER_MANIFEST sidecar of file_dest_dir) are skipped
     '''
 
-    import ROOT # only need ROOT for this function
-
     if file_type==u"root":
         filelist = glob.glob(file_loc+u'/*.root')
-    elif file_type==u"h5": # not yet implemented
+        loader = loadSparseSpecRoot
+    elif file_type==u"h5":
         filelist = glob.glob(file_loc+u'/*.h5')
+        loader = loadSparseSpecH5
+    else:
+        raise Exception(u"Unknown file type {}. Use root or h5.".format(file_type))
 
     if not filelist:
         raise Exception(u"No files found in {}. Aborting.".format(file_loc))
 
-    for idx_file, ii_file in enumerate(filelist):
-
-        # Getting name for spectrogram from filename
-        filename = os.path.split(ii_file)[1] # splits path and keeps file name
-        print u'Source file: {}'.format(filename)
-        filename = os.path.splitext(filename)[0] # removes extension
-        # Load file
-        file = ROOT.TFile(ii_file)
-        print 'ii_file: {}'.format(ii_file)
-
-        try:
-            disc = file.Get("discPoints1D") # Discrim points
-            NPoints = disc.GetEntries()
-        except AttributeError:
-            print u"\tNo discPoints1D data found. Skipping..."
-            continue # next file since without discrim points we don't care for tracks/events
-
-        else: # if there's no exception execute this block
-
-            # LOADING DATA
-
-            freq = np.zeros(NPoints) # allocate space
-            time = np.zeros(NPoints)
-            # Collect frequencies and times in run
-            for ii_point in xrange(NPoints):
-                disc.GetEntry(ii_point)
-                freq[ii_point] = disc.fAbscissa
-                time[ii_point] = disc.fTimeInRunC
-
-            if (flag_plot_tracks) or (flag_plot_evts):
-                try:
-                    mtevents = file.Get('multiTrackEvents')
-                except Exception as e:
-                    print '\tNo multiTrackEvents data found. Skipping...'
-                else:
-                    event = mtevents.FindBranch('Event')
-                    NEvents = mtevents.GetEntries()
-
-            # Plot tracks?
-            if flag_plot_tracks:
-                try:
-                    tracks = event.FindBranch('fTracks')
-                    NTracks = tracks.GetEntries()
-                except AttributeError:
-                    print u'\tNo procTracks data found. Skipping...'
-                    continue
-                else:
-                    trackfreqs = np.zeros((2*NTracks,2)) # To plot lines we need pairs of freqs (start/end) which set the y limits of the line
-                    tracktimes = np.zeros((2*NTracks,2)) # To plot lines we need pairs of times (start/end) which set the x limits of the line
-                    for ii_point in np.arange(0,NTracks): # collect data points, each is a 2-element tuple
-                        tracks.GetEntry(ii_point) # gets 2-element tuple (don't know why it's formatted this way)
-                        branch1 = tracks.FindBranch('fTracks.fStartFrequency')
-                        leaf1 = branch1.FindLeaf('fTracks.fStartFrequency')
-                        branch2 = tracks.FindBranch('fTracks.fEndFrequency')
-                        leaf2 = branch2.FindLeaf('fTracks.fEndFrequency')
-                        branch3 = tracks.FindBranch('fTracks.fStartTimeInRunC')
-                        leaf3 = branch3.FindLeaf('fTracks.fStartTimeInRunC')
-                        branch4 = tracks.FindBranch('fTracks.fEndTimeInRunC')
-                        leaf4 = branch4.FindLeaf('fTracks.fEndTimeInRunC')
-                        for jj_point in range(2): # we need both
-                            trackfreqs[2*ii_point+jj_point] = np.array([leaf1.GetValue(jj_point),leaf2.GetValue(jj_point)])
-                            tracktimes[2*ii_point+jj_point] = np.array([leaf3.GetValue(jj_point),leaf4.GetValue(jj_point)])
-
-            # Plot events?
-            if flag_plot_evts:
-                evtstartfreqs = np.zeros(NEvents) # allocate space
-                evtstarttimes = np.zeros(NEvents)
-                for ii_point in xrange(NEvents): # collect data points
-                    mtevents.GetEntry(ii_point)
-                    leaf1 = mtevents.FindLeaf(u"fStartFrequency")
-                    leaf2 = mtevents.FindLeaf(u"fStartTimeInRunC")
-                    evtstartfreqs[ii_point] = leaf1.GetValue()
-                    evtstarttimes[ii_point] = leaf2.GetValue()
-
-            # PLOTTING
-
-            # Data files (h5/root) come from concatenated mat files and thus have huge time gaps
-            # We want to get spectrograms from separate acquisitions
-            # So we find the time gaps in the data set and save them for later use in the plots
-            time_sorted = np.sort(time)
-            time_diff = np.diff(time_sorted) # misses the last time limit
-            time_upperlim = time_sorted[np.where(time_diff>0.1)[0]]
-            time_upperlim = np.append(time_upperlim,time[-1]) # include the last time limit
-
-            if file_dest_dir is not None:
-                print u'\tSaving files to: {}'.format(file_dest_dir)
-            for idx_timelim,ii_timelim in enumerate(time_upperlim): # loop through acquistions in file
-                acq_time_start = ii_timelim-acq_length # start time of this acqusition
-                spec_name = filename+u"_{}".format(idx_timelim)
-                kwargs = {u'spec_name':spec_name,u'file_dest_dir':file_dest_dir} # we'll pas in a kwarg dict for convenience instead of passing in every kwarg argument to plot function
-                if flag_plot_tracks: # if so add track information to kwargs
-                    acq_cut = (tracktimes[:,0]>=acq_time_start) & (tracktimes[:,1]<=ii_timelim) # cut for tracks within this acquistion only
-                    tracktimes_inrun = tracktimes[acq_cut] # track start and end times in this acqusition
-                    trackfreqs_inrun = trackfreqs[acq_cut] # track start and end frequencies in this acquisition
-                    kwargs[u'tracktimes_inrun'] = tracktimes_inrun # to send to plotSparseSpec
-                    kwargs[u'trackfreqs_inrun'] = trackfreqs_inrun
-                if flag_plot_evts: # if so add event information to kwargs
-                    acq_cut = (evtstarttimes>=acq_time_start) & (evtstarttimes<=ii_timelim) # cut for events within this acquistion only
-                    evtstarttimes_inrun = evtstarttimes[acq_cut] # event start times in this acqusition
-                    evtstartfreqs_inrun = evtstartfreqs[acq_cut] # events start frequencies in this acqusition
-                    kwargs[u'evtstarttimes_inrun'] = evtstarttimes_inrun # to send to plotSparseSpec
-                    kwargs[u'evtstartfreqs_inrun'] = evtstartfreqs_inrun
-                acq_cut = (time>=acq_time_start) & (time<=ii_timelim) # time cut for a single acqusition
-                plotSparseSpec(time[acq_cut],freq[acq_cut],**kwargs)
-                plt.pause(0.05)
+    params = {u'file_type':file_type,u'acq_length':acq_length,u'flag_plot_tracks':flag_plot_tracks,
+              u'flag_plot_evts':flag_plot_evts,u'raster_bins':raster_bins}
+    manifest = loadRenderManifest(file_dest_dir) if file_dest_dir is not None else {}
+
+    # Find the stale files first so that every one of them is spread over the pool at once
+    entries = {}
+    tasks = []
+    for ii_file in sorted(filelist):
+        source = os.path.abspath(ii_file)
+        entry = renderEntry(ii_file,params)
+        if file_dest_dir is not None and not flag_force and isUpToDate(entry,manifest.get(source),file_dest_dir):
+            print(u'Source file: {}\n\tImages up to date. Skipping...'.format(os.path.basename(ii_file)))
+            continue
+
+        entries[ii_file] = entry
+        tasks.append((ii_file,loader,file_dest_dir,acq_length,flag_plot_tracks,flag_plot_evts,raster_bins))
+
+    pool = multiprocessing.Pool(workers) if workers != 1 and tasks else None
+    try:
+        if pool is not None:
+            results = pool.imap_unordered(processSparseSpecFileJob,tasks)
+        else:
+            results = (processSparseSpecFileJob(task) for task in tasks)
+
+        # Record every file in the manifest as soon as it is done so an interrupted run keeps its progress
+        for ii_file, outputs in results:
+            if file_dest_dir is not None and outputs is not None:
+                entries[ii_file][u'outputs'] = [os.path.basename(output) for output in outputs if output is not None]
+                manifest[os.path.abspath(ii_file)] = entries[ii_file]
+                saveRenderManifest(file_dest_dir,manifest)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
     return
 
+def processSparseSpecFileJob(task):
+    u'''
+    Pool entry point of processSparseSpecFile(); task is the tuple of its arguments
+    Returns (file name, outputs of processSparseSpecFile())
+    '''
+
+    return (task[0], processSparseSpecFile(*task))
+
+def processSparseSpecFile(ii_file,loader,file_dest_dir,acq_length,flag_plot_tracks,flag_plot_evts,raster_bins):
+    u'''
+    Loads a single file and renders its acquisitions for processSparseSpec() (see there for the arguments)
+    loader (function): loadSparseSpecRoot() or loadSparseSpecH5()
+    Returns the list of saved images (None for acquisitions which were not saved) or None if the file has no data to plot
+    '''
+
+    # Getting name for spectrogram from filename
+    filename = os.path.split(ii_file)[1] # splits path and keeps file name
+    print(u'Source file: {}'.format(filename))
+    filename = os.path.splitext(filename)[0] # removes extension
+
+    loaded = loader(ii_file,flag_plot_tracks=flag_plot_tracks,flag_plot_evts=flag_plot_evts)
+    if loaded is None:
+        return None # next file
+
+    time, freq, tracktimes, trackfreqs, evtstarttimes, evtstartfreqs = loaded
+
+    if not time.size:
+        print(u"\tNo discriminated points found. Skipping...")
+        return None
+
+    # PLOTTING
+
+    # Data files (h5/root) come from concatenated mat files and thus have huge time gaps
+    # We want to get spectrograms from separate acquisitions so we index the acquisitions once
+    # and sort every array so each acquisition is a contiguous slice
+    index = acquisitionIndex(time,acq_length,tracktimes if flag_plot_tracks else None,evtstarttimes if flag_plot_evts else None)
+
+    order, pnt_starts, pnt_ends = index[u'points']
+    time, freq = time[order], freq[order]
+    if flag_plot_tracks:
+        order, trk_starts, trk_ends = index[u'tracks']
+        tracktimes, trackfreqs = tracktimes[order], trackfreqs[order]
+    if flag_plot_evts:
+        order, evt_starts, evt_ends = index[u'events']
+        evtstarttimes, evtstartfreqs = evtstarttimes[order], evtstartfreqs[order]
+
+    if file_dest_dir is not None:
+        print(u'\tSaving files to: {}'.format(file_dest_dir))
+    jobs = []
+    for idx_timelim,ii_timelim in enumerate(index[u'upperlims']): # loop through acquistions in file
+        spec_name = filename+u"_{}".format(idx_timelim)
+        kwargs = {u'spec_name':spec_name,u'file_dest_dir':file_dest_dir,u'raster_bins':raster_bins} # we'll pas in a kwarg dict for convenience instead of passing in every kwarg argument to plot function
+        if flag_plot_tracks: # if so add track information to kwargs
+            acq_slice = slice(trk_starts[idx_timelim],trk_ends[idx_timelim]) # tracks starting within this acquistion
+            acq_cut = tracktimes[acq_slice,1]<=ii_timelim # which must also end within it
+            kwargs[u'tracktimes_inrun'] = tracktimes[acq_slice][acq_cut] # track start and end times in this acqusition
+            kwargs[u'trackfreqs_inrun'] = trackfreqs[acq_slice][acq_cut] # track start and end frequencies in this acquisition
+        if flag_plot_evts: # if so add event information to kwargs
+            acq_slice = slice(evt_starts[idx_timelim],evt_ends[idx_timelim]) # events within this acquistion only
+            kwargs[u'evtstarttimes_inrun'] = evtstarttimes[acq_slice] # event start times in this acqusition
+            kwargs[u'evtstartfreqs_inrun'] = evtstartfreqs[acq_slice] # events start frequencies in this acqusition
+        acq_slice = slice(pnt_starts[idx_timelim],pnt_ends[idx_timelim]) # points of a single acqusition
+        kwargs[u'discrim_time'] = time[acq_slice]
+        kwargs[u'discrim_freq'] = freq[acq_slice]
+        jobs.append(kwargs)
+
+    return [plotSparseSpecJob(kwargs) for kwargs in jobs]
+
 
 if __name__ == '__main__':
     dest_dir1 = "/home/jswerdlow/classifier/figures/tracks_found"
@@ -12,22 +12,69 @@ import os
 import re
 import sys
 import math
+import time
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 import h5py as h5
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import h5tree
 import stable_matching as sm
 from process import *
+from reducers import Histogram, Histogram2D, reduce_seeds
+
+# Returns (ax, own) the axes to draw on and whether they were created here.
+# Without given axes a new pyplot figure with the given name is made.
+def _axes(ax, name):
+    if ax is not None:
+        return (ax, False)
+
+    fig, ax = plt.subplots(num=name, clear=True)
+
+    return (ax, True)
+
+# Saves the figure of the axes into save_dir (if it exists), shows it and closes
+# it if the figure was created by the plotting function itself
+def _finish(ax, fn, save_dir=None, show=False, own=True):
+    if save_dir is not None:
+        if os.path.isdir(save_dir):
+            ax.figure.savefig(os.path.join(save_dir, fn))
+
+    if show:
+        plt.show()
+
+    if own:
+        plt.close(ax.figure)
+
+# Draws a histogram from its counts alone (see reducers.Histogram)
+def draw_hist(hist, ax, **kwargs):
+    ax.stairs(hist.counts, hist.edges, fill=True, **kwargs)
+
+# Draws a two dimensional histogram from its counts alone as a density image
+# (empty bins are left blank, see reducers.Histogram2D). The colormap is dark at its
+# low end so that bins holding a single entry stand out from the background.
+def draw_hist2d(hist, ax, **kwargs):
+    kwargs.setdefault('cmap', 'viridis')
+    kwargs.setdefault('vmin', 0)
+    counts = np.ma.masked_equal(hist.counts, 0)
+    mesh = ax.pcolormesh(hist.xedges, hist.yedges, counts.T, **kwargs)
+    ax.figure.colorbar(mesh, ax=ax, label='Counts')
 
 # Creates a histgram of the start times from the given data
-def start_time_hist(data, binwidth=0.025e-3, filtered=False, save_dir=None, show=False):
+#   hist [default: None]: A Histogram to add the data to (i.e. one shared with other
+#       workers), by default a new one with bins of binwidth
+#   ax [default: None]: The matplotlib axes to draw on, by default a new figure
+def start_time_hist(data, binwidth=0.025e-3, filtered=False, save_dir=None, show=False, hist=None, ax=None):
     """
     start_times (s)
     """
-    seeds = data.keys()
-
     group = 'candidate_tracks'
     dataset = 'candidate_tracks_0'
     start_time = 'StartTimeInAcq'
@@ -38,31 +85,26 @@ def start_time_hist(data, binwidth=0.025e-3, filtered=False, save_dir=None, show
         dataset += "_"
         start_time += "_"
 
-    egg_times = list()
+    if hist is None:
+        hist = Histogram([group, dataset, start_time], binwidth=binwidth)
 
-    for seed in seeds:
-        egg_times += list(data[seed][group][dataset][start_time])
+    reduce_seeds(((seed, None, seed_data) for seed, seed_data in data.items()), hist)
 
-    egg_bins = np.arange(min(egg_times), max(egg_times) + binwidth, binwidth)
-    plt.figure('Start Time Hist')
-    plt.hist(egg_times, bins=egg_bins, color='b')
+    ax, own = _axes(ax, 'Start Time Hist')
+    draw_hist(hist, ax, color='b')
 
     # S E T T T I N G S
-    plt.xlabel('Start Time [S]')
-    plt.ylabel('Counts')
-    plt.ylim((0,55))
-    plt.title(title)
-    plt.grid()
+    ax.set_xlabel('Start Time [S]')
+    ax.set_ylabel('Counts')
+    ax.set_ylim((0,55))
+    ax.set_title(title)
+    ax.grid()
 
-    if save_dir is not None:
-        if os.path.isdir(save_dir):
-            fn = "startTimeHistogram.png"
-            plt.savefig(os.path.join(save_dir, fn))
+    _finish(ax, "startTimeHistogram.png", save_dir, show, own)
 
-    if show:
-        plt.show()
+    return hist
 
-def start_freq_hist(data, binwidth=0.1, filtered=False, save_dir=None, show=False, pitch_times=None, pitch_angls=None):
+def start_freq_hist(data, binwidth=0.1, filtered=False, save_dir=None, show=False, pitch_times=None, pitch_angls=None, hist=None, ax=None):
     """
     start_freqs (MHz)
     binwidth (MHz)
@@ -80,32 +122,27 @@ def start_freq_hist(data, binwidth=0.1, filtered=False, save_dir=None, show=Fals
         dataset += "_"
         freq += "_"
 
-    seeds = data.keys()
-    egg_freqs = list()
-    for seed in seeds:
-        egg_freqs += list(data[seed][group][dataset][freq] * hz_to_Mhz)
+    if hist is None:
+        hist = Histogram([group, dataset, freq], scale=hz_to_Mhz, binwidth=binwidth)
+
+    reduce_seeds(((seed, None, seed_data) for seed, seed_data in data.items()), hist)
 
-    egg_bins = np.arange(min(egg_freqs), max(egg_freqs) + binwidth, binwidth)
-    plt.figure('Start Freq Hist')
-    plt.hist(egg_freqs, bins=egg_bins)
+    ax, own = _axes(ax, 'Start Freq Hist')
+    draw_hist(hist, ax)
 
     # S E T T T I N G S
-    plt.title(title)
-    plt.ylabel("Counts")
-    # plt.ylim((0,20))
-    plt.xlabel("Frequency [MHz]")
-    plt.grid()
+    ax.set_title(title)
+    ax.set_ylabel("Counts")
+    # ax.set_ylim((0,20))
+    ax.set_xlabel("Frequency [MHz]")
+    ax.grid()
 
-    if save_dir is not None:
-        if os.path.isdir(save_dir):
-            fn = "startFreqHist.png"
-            plt.savefig(os.path.join(save_dir, fn))
+    _finish(ax, "startFreqHist.png", save_dir, show, own)
 
-    if show:
-        plt.show()
+    return hist
 
-# Scatterpolot of startfreq vs slope
-def start_freq_v_slope(data, filtered=False, save_dir=None, show=False):
+# Density plot of startfreq vs slope
+def start_freq_v_slope(data, filtered=False, save_dir=None, show=False, hist=None, ax=None):
     hz_to_Mhz = 1e-6 # hertz to megahertz
     s_to_ms = 1e3 # seconds to milliseconds
     hzPs_to_MHzPms = 1e-9 # hz/s to MHz/ms
@@ -120,34 +157,30 @@ def start_freq_v_slope(data, filtered=False, save_dir=None, show=False):
     if filtered:
         dataset += "_"
         freq += "_"
+        slope += "_"
 
-    seeds = data.keys()
-    startFreqs = list()
-    slopes = list()
-    for seed in seeds:
-        startFreqs += list(data[seed][group][dataset][freq] * hz_to_Mhz)
-        slopes += list(data[seed][group][dataset][slope])
+    # Plot in range 105 to 118 MHz on x-axis and 0 to 1.5e9 Hz/s on y-axis.
+    if hist is None:
+        hist = Histogram2D([group, dataset, freq], [group, dataset, slope],
+                           xedges=np.linspace(105, 118, 131), yedges=np.linspace(0, 1.5e9, 151), xscale=hz_to_Mhz)
 
-    # Plot in range 1049.5 to 1053 MHz on x-axis and 0.2 to 0.95 MHz/ms on y-axis.
-    plt.figure('Slope v Start Frequency')
-    plt.scatter(startFreqs, slopes, facecolors='none', edgecolors='b', alpha=0.5,)
+    reduce_seeds(((seed, None, seed_data) for seed, seed_data in data.items()), hist)
 
-    plt.title(title)
-    plt.xlabel("Start Frequency [MHz]")
-    plt.ylabel("Slope [MHz/ms]")
-    plt.grid()
-    plt.xlim((105,118))
-    plt.ylim((0,1.5e9))
+    ax, own = _axes(ax, 'Slope v Start Frequency')
+    draw_hist2d(hist, ax)
 
-    if save_dir is not None:
-        if os.path.isdir(save_dir):
-            fn = 'startFreq_v_slope.png'
-            plt.savefig(os.path.join(save_dir, fn))
+    ax.set_title(title)
+    ax.set_xlabel("Start Frequency [MHz]")
+    ax.set_ylabel("Slope [MHz/ms]")
+    ax.grid()
+    ax.set_xlim((105,118))
+    ax.set_ylim((0,1.5e9))
 
-    if show:
-        plt.show()
+    _finish(ax, 'startFreq_v_slope.png', save_dir, show, own)
 
-def power_v_slope(data, filtered=False, save_dir=None, show=False):
+    return hist
+
+def power_v_slope(data, filtered=False, save_dir=None, show=False, hist=None, ax=None):
     hz_to_Mhz = 1e-6 # hertz to megahertz
     s_to_ms = 1e3 # seconds to milliseconds
     hzPs_to_MHzPms = 1e-9 # hz/s to MHz/ms
@@ -161,85 +194,97 @@ def power_v_slope(data, filtered=False, save_dir=None, show=False):
 
     if filtered:
         dataset += "_"
-        freq += "_"
+        totPower += "_"
+        slope += "_"
 
-    power = list()
-    slopes = list()
-    seeds = data.keys()
-    for seed in seeds:
-        power += list(data[seed][group][dataset][totPower] * 1e-1)
-        slopes += list(data[seed][group][dataset][slope])
+    # Plot in range 200e6 to 800e6 Hz/s on x-axis and 0 to 50e-21 W/Hz on y-axis.
+    if hist is None:
+        hist = Histogram2D([group, dataset, slope], [group, dataset, totPower],
+                           xedges=np.linspace(200e6, 800e6, 121), yedges=np.linspace(0, 50e-21, 101), yscale=1e-1)
 
-    # Plot in range 1049.5 to 1053 MHz on x-axis and 0.2 to 0.95 MHz/ms on y-axis.
-    plt.figure('Power v Slope')
-    plt.scatter(slopes, power, facecolors='none', edgecolors='b', alpha=0.5)
+    reduce_seeds(((seed, None, seed_data) for seed, seed_data in data.items()), hist)
 
-    plt.title(title)
-    plt.xlabel("Slope [Hz/s]")
-    plt.ylabel("Power [W/Hz]")
-    plt.grid()
+    ax, own = _axes(ax, 'Power v Slope')
+    draw_hist2d(hist, ax)
 
-    plt.xlim((200e6, 800e6))
-    plt.ylim((0, 50e-21))
+    ax.set_title(title)
+    ax.set_xlabel("Slope [Hz/s]")
+    ax.set_ylabel("Power [W/Hz]")
+    ax.grid()
 
-    if save_dir is not None:
-        if os.path.isdir(save_dir):
-            fn = 'power_v_slope.png'
-            plt.savefig(os.path.join(save_dir, fn))
+    ax.set_xlim((200e6, 800e6))
+    ax.set_ylim((0, 50e-21))
 
-    if show:
-        plt.show()
+    _finish(ax, 'power_v_slope.png', save_dir, show, own)
 
-# Implements Gale-Shapley (Asymmetric) Stable Match Algorithm
-# The preference matrices (propPref, acptPref) are constructed
-# by sort the different of proposer_i with all acceptors and vice versa
-# NOTE: Proposers must always be the smaller set
-def stable_matching(proposers, acceptors, tol):
-    if not isinstance(proposers, np.ndarray) or not isinstance(acceptors, np.ndarray):
-        sys.exit("Stable-Matching Error: proposers and acceptors must be numpy arrays.")
+    return hist
+
+# A figure to render: the plotting function, the seeds of the data it is given (None
+# for every seed), the output path and any keyword arguments of the function
+PlotJob = namedtuple('PlotJob', ['function', 'seeds', 'path', 'kwargs'])
 
-    P = proposers.size
-    A = acceptors.size
-    data_format = {'names': ['difference', 'values'],
-                   'formats': [np.float32, np.float32]}
+# Returns the PlotJobs of the test property figures in save_dir. With per_seed every
+# seed also gets the same figures in save_dir/<seed>/
+def property_jobs(seeds, save_dir="./figures/test_properties/", per_seed=False):
+    figures = [(start_time_hist, "startTimeHistogram.png", {}),
+               (start_freq_hist, "startFreqHist.png", {'binwidth': 0.5}),
+               (start_freq_v_slope, 'startFreq_v_slope.png', {}),
+               (power_v_slope, 'power_v_slope.png', {})]
 
-    # Instantiate the proposers and acceptors preference matrices
-    propPref = np.zeros(shape=(P, A), dtype=data_format)
-    acptPref = np.zeros(shape=(A, P), dtype=data_format)
+    jobs = [PlotJob(function, None, os.path.join(save_dir, fn), kwargs) for function, fn, kwargs in figures]
 
-    # Construct the difference matrix by doing the element-wise subtraction
-    # shape = (P, A)
-    diff = np.absolute(np.subtract(proposers[:, None], acceptors))
+    if per_seed:
+        for seed in seeds:
+            jobs += [PlotJob(function, [seed], os.path.join(save_dir, seed, fn), kwargs) for function, fn, kwargs in figures]
 
-    # Then filter the diff matrix by the tolerance
-    np.putmask(diff, diff > tol, 0)
+    return jobs
 
-    # Initialize the proposer and acceptor preference matrices
-    propPref['difference'] = diff
-    propPref['values'] = acceptors
+# Draws one PlotJob on a figure of its own (never registered with pyplot, so nothing
+# stays open) and saves it.
+#   Returns: (path, seconds) the time taken to draw and save the figure
+def _render_job(job, data):
+    start = time.perf_counter()
 
-    acptPref['difference'] = np.transpose(diff)
-    acptPref['values'] = proposers
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    job.function(data, ax=fig.add_subplot(), **job.kwargs)
 
-    # Sort (small to large) the prefence matrices by row
-    # on the difference component
-    np.ndarray.sort(propPref, axis=1, order='difference', kind='mergesort')
-    np.ndarray.sort(acptPref, axis=1, order='difference', kind='mergesort')
+    os.makedirs(os.path.dirname(job.path) or '.', exist_ok=True)
+    fig.savefig(job.path)
+    fig.clear()
 
-    print("Proposer Preferences: \n{}".format(propPref))
-    print("Acceptor Preferences: \n{}".format(acptPref))
+    return (job.path, time.perf_counter() - start)
 
-    # Initialize a custom object for both proposers and acceptors
-    # I should fina  way to make these iterable
-    Proposers = sm.ElementArray(proposers)
-    Acceptors = sm.ElementArray(acceptors)
+"""
+Renders a list of PlotJobs headless (Agg canvas, object oriented matplotlib only)
+    jobs: A list of PlotJob
+    data: The dictionary keyed by seed the jobs select their seeds from (i.e. from process_files)
+    workers [default: None]: The number of processes drawing figures. None uses every core
+        and 1 draws every figure in this process.
+
+    Returns: A list of (path, seconds) with the time taken by every figure, in the order of jobs
+"""
+def render_figures(jobs, data, workers=None):
+    selections = list()
+    for job in jobs:
+        seeds = list(data.keys()) if job.seeds is None else job.seeds
+        selections.append(dict((seed, data[seed]) for seed in seeds))
 
-    # Initialize a custom object for matches
-    Matches = sm.Matches()
+    if workers == 1:
+        return [_render_job(job, selection) for job, selection in zip(jobs, selections)]
 
-    # Initialize a custom object for proposer and acceptor preferences
-    # PropPref = sm.PreferenceMatrix(Proposers, propPref['values'])
-    # AcptPref = sm.PreferenceMatrix(Acceptors, acptPref['values'])
+    # Open hdf5 handles cannot be shared with the worker processes
+    h5tree.close_files()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_job, jobs, selections))
+
+# Implements Gale-Shapley Stable Match Algorithm
+# Stably matches the proposers to the acceptors (i.e. egg times to pitch times)
+# by closeness within the tolerance
+#   Returns: (proposer_indices, acceptor_indices) of the matched pairs
+def stable_matching(proposers, acceptors, tol):
+    return sm.stable_match(proposers, acceptors, tol)
 
 
 if __name__ == "__main__":
@@ -248,10 +293,9 @@ if __name__ == "__main__":
     # Process all the data in default directories
     seeds, files, data = process_files()
     save_dir = "./figures/test_properties/"
-    start_time_hist(data, save_dir=save_dir)
-    start_freq_hist(data, binwidth=0.5, save_dir=save_dir)
-    start_freq_v_slope(data, save_dir=save_dir)
-    power_v_slope(data, save_dir=save_dir)
+
+    for path, seconds in render_figures(property_jobs(seeds, save_dir), data):
+        print("Rendered {} in {:.2f} s".format(path, seconds))
 
 
     # Run through the files and construct the necessary plots
@@ -333,4 +377,7 @@ def test_stable_matching():
     B = np.random.random(5)
     A = np.array([5, 0, 5, 10])
     B = np.array([3, 6])
-    stable_matching(A, B, 2)
\ No newline at end of file
+    prop_indices, acpt_indices = stable_matching(A, B, 2)
+
+    for p, a in zip(prop_indices, acpt_indices):
+        print("Matched {} with {}".format(A[p], B[a]))
\ No newline at end of file
@@ -1,16 +1,31 @@
+import json
 import os
 import re
 import sys
+import zipfile
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import h5py as h5
 import numpy as np
 import pandas as pd
 
-from copy import copy, deepcopy
+import h5tree
+import rootcache
+import seedcache
+import seedmanifest
+
+from coincidences import band_pairs, optimal_pairs
+
+from copy import copy
 
 # Fetches the given variables from the given hdf5 file
 # with a group and dataset storing all the variables data
-def fetch_variables_hdf5(fn, group, dataset, variables):
+#   rows [default: None]: A slice or boolean mask selecting the rows to read
+#
+#   Returns a dictionary of typed numpy arrays keyed by variable or -1 on failure.
+#   Note: variables not found in the dataset are removed from the variables list
+def fetch_variables_hdf5(fn, group, dataset, variables, rows=None):
 
     if not fn.endswith(".h5"):
         sys.exit("Error: File '{}' is not HDF5.".format(fn))
@@ -19,82 +34,383 @@ def fetch_variables_hdf5(fn, group, dataset, variables):
     with h5.File(fn, "r") as hf:
 
         # Get the group object unless failure
-        try:
-            gp = hf.get(group)
-        except AttributeError:
+        gp = hf.get(group)
+        if not isinstance(gp, h5.Group):
             sys.stderr.write("'{}' has no group: {}.\n".format(fn, group))
             return -1
 
         # Get the dataset object unless failure
-
-        try:
-            ds = gp.get(dataset)
-        except AttributeError:
+        ds = gp.get(dataset)
+        if not isinstance(ds, h5.Dataset):
             sys.stderr.write("'{}' has no dataset: {}.\n".format(fn, dataset))
             return -1
 
         # Go through the dataset and check what variables
         # are actually in the dataset
-        data = dict()
-        for variable in variables:
-            if variable in ds.dtype.names:
-                data[variable] = list()
-            else:
+        names = ds.dtype.names or ()
+        for variable in list(variables):
+            if variable not in names:
                 sys.stderr.write("'{}' was not found in the dataset.\n".format(variable))
                 variables.remove(variable)
 
-        # Find the location of all of the variables
-        indices = list()
-        for variable in variables:
-            indices.append(ds.dtype.names.index(variable))
+        if not variables:
+            return dict()
+
+        # Read every requested column out of the compound dataset at once
+        columns = _read_rows(ds.fields(list(variables)), ds.shape[0], rows)
 
-        # We must manipulate the values to be in an appropriate form
-        # At the moment, it is 11x37 in which each column corresponds to
-        # a single value for one of the 37 variables
-        for variable, index in zip(variables, indices):
-            for d in ds:
-                data[variable].append(d[index])
+    # Split the compound array into contiguous typed arrays per variable
+    data = dict()
+    for variable in variables:
+        data[variable] = np.ascontiguousarray(columns[variable])
 
     return data
 
+# Helper function to read the rows selected by fetch_variables_hdf5 in a single
+# read. A boolean mask is applied after reading the span it covers.
+def _read_rows(reader, nrows, rows):
+    if rows is None:
+        return reader[0:nrows]
+
+    if isinstance(rows, slice):
+        return reader[rows]
+
+    rows = np.asarray(rows)
+    if rows.dtype != bool or rows.shape != (nrows,):
+        sys.exit("Error: rows must be a slice or a boolean mask with {} entries.".format(nrows))
+
+    hits = np.flatnonzero(rows)
+    if hits.size == 0:
+        return reader[0:0]
+
+    span = reader[hits[0]:hits[-1] + 1]
+
+    return span[rows[hits[0]:hits[-1] + 1]]
+
 # Extract time and pitch angles data from a text file
+# Returns: (times, pitch_angles) as numpy float arrays
 def get_pitch_data(fn):
+    values = seedcache.parse_pitch_file(fn)
+
+    return (np.ascontiguousarray(values[:, 0]), np.ascontiguousarray(values[:, 1]))
+
+class PitchData():
+    """
+        Summary: The pitch angle data of many seeds stored in two contiguous arrays with
+                    a CSR style offset array: the rows of seeds[i] are offsets[i]:offsets[i + 1].
+
+        Attributes:
+            seeds: A list of the seed values (i.e. 'Seed100') in file order
+            times: A float array of every pitch time
+            angles: A float array of every pitch angle
+            offsets: An integer array of len(seeds) + 1 row offsets
+    """
+    def __init__(self, seeds, times, angles, offsets):
+        self.seeds = list(seeds)
+        self.times = times
+        self.angles = angles
+        self.offsets = offsets
+
+        self._index = dict((seed, i) for i, seed in enumerate(self.seeds))
+
+    def __len__(self):
+        return len(self.seeds)
+
+    # Returns (times, angles) of a single seed as views (no copy) of the full arrays
+    def seed(self, seed):
+        i = self._index[seed]
+        beg, end = self.offsets[i], self.offsets[i + 1]
+
+        return (self.times[beg:end], self.angles[beg:end])
 
-    times = list()
-    pitch_angles = list()
+"""
+Loads many pitch angle files into a single PitchData object.
+    pitch_files: A list of pitch angle files (i.e. pitchangles_SeedXXX.txt)
+    cache [default: None]: A path to a binary (.npz) cache. If the cache holds the
+        same files with unchanged fingerprints (mtime and size) it is loaded instead
+        of parsing the text files, otherwise it is (re)written after parsing.
+"""
+def load_pitch_data(pitch_files, cache=None):
+    seeds = [extract_seed(fn) for fn in pitch_files]
+    fingerprints = np.array([seedcache.fingerprint(fn) for fn in pitch_files], dtype=np.int64).reshape(-1, 2)
+
+    # An unreadable cache (i.e. from an interrupted write) is a miss and is rewritten below
+    if cache is not None and os.path.isfile(cache):
+        try:
+            with np.load(cache) as npz:
+                if list(npz['seeds']) == seeds and np.array_equal(npz['fingerprints'], fingerprints):
+                    return PitchData(seeds, npz['times'], npz['angles'], npz['offsets'])
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            sys.stderr.write("Warning: Could not read the pitch cache '{}', rebuilding it.\n".format(cache))
+
+    chunks = [seedcache.parse_pitch_file(fn) for fn in pitch_files]
+
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+
+    values = np.concatenate(chunks) if chunks else np.zeros((0, 2))
+    times = np.ascontiguousarray(values[:, 0])
+    angles = np.ascontiguousarray(values[:, 1])
+
+    # Write next to the cache and swap it in so an interrupted write never leaves half a file
+    if cache is not None:
+        with open(cache + '.tmp', 'wb') as f:
+            np.savez(f, seeds=np.array(seeds, dtype=str), fingerprints=fingerprints,
+                     times=times, angles=angles, offsets=offsets)
+
+        os.replace(cache + '.tmp', cache)
+
+    return PitchData(seeds, times, angles, offsets)
+
+# Returns the index of the nearest reference time for every time given along
+# with the absolute difference between the two. The reference times are sorted
+# once and searched with a binary search so the cost is O((N + M) log M).
+# If there are no reference times the indices are -1 and the differences inf.
+def nearest_times(times, ref_times):
+    times = np.asarray(times, dtype=float)
+    ref_times = np.asarray(ref_times, dtype=float)
 
-    with open(fn, 'r') as f:
-        for line in f:
-            time, pitch_angle = line.split()
+    if ref_times.size == 0:
+        return (np.full(times.shape, -1, dtype=np.intp), np.full(times.shape, np.inf))
 
-            times.append(float(time))
-            pitch_angles.append(float(pitch_angle))
+    # Stable sort so that equal reference times resolve to the earliest index
+    order = np.argsort(ref_times, kind='mergesort')
+    ref_sorted = ref_times[order]
 
-    return (times, pitch_angles)
+    # Candidates are the sorted neighbours on either side of the insertion point
+    right = np.searchsorted(ref_sorted, times, side='left')
+    right = np.clip(right, 0, ref_sorted.size - 1)
+    left = np.clip(right - 1, 0, ref_sorted.size - 1)
+
+    right_diff = np.abs(ref_sorted[right] - times)
+    left_diff = np.abs(ref_sorted[left] - times)
+
+    # Prefer the left neighbour on ties (it has the smaller time)
+    nearest = np.where(left_diff <= right_diff, left, right)
+    diffs = np.minimum(left_diff, right_diff)
+
+    # Move to the first of any run of equal reference times
+    nearest = np.searchsorted(ref_sorted, ref_sorted[nearest], side='left')
+
+    return (order[nearest], diffs)
 
 # Returns the appropriate indices for the times which match with one another
-# (within a tolerance) for both list objects provided
-def compare_times(egg_times, pitch_times):
+# (within a tolerance) for both array-like objects provided
+#   tol [default: 2e-4]: Largest time difference (s) allowed for a match
+#   one_to_one [default: False]: If True no pitch time is matched to more than
+#       one egg time. Conflicts go to the closest egg time and the others are
+#       retried against the pitch times that are still unclaimed.
+#   optimal [default: False]: If True the times are assigned one to one so that the
+#       most times are matched with the least total time difference (needs scipy)
+#
+#   Returns: (egg_indices, pitch_indices) as numpy integer arrays ordered by egg index
+def compare_times(egg_times, pitch_times, tol=2e-4, one_to_one=False, optimal=False):
+    egg_times = np.asarray(egg_times, dtype=float)
+    pitch_times = np.asarray(pitch_times, dtype=float)
+
+    if optimal:
+        return optimal_pairs(band_pairs(egg_times, pitch_times, tol))
 
-    # Change numpy arrays to lists before computation
-    if isinstance(egg_times, np.ndarray):
-        egg_times = list(egg_times)
+    if not one_to_one:
+        ptch_indices, diffs = nearest_times(egg_times, pitch_times)
+        time_indices = np.flatnonzero(diffs < tol)
 
-    if isinstance(pitch_times, np.ndarray):
-        pitch_times = list(pitch_times)
+        return (time_indices, ptch_indices[time_indices])
 
-    tol = 2e-4
     time_indices = list()
     ptch_indices = list()
-    for et in egg_times:
-        for pt in pitch_times:
-            diff = abs(et - pt)
-            if diff < tol:
-                ptch_indices.append(pitch_times.index(pt))
-                time_indices.append(egg_times.index(et))
-                break
 
-    return (time_indices, ptch_indices)
+    # Each pass matches the pending egg times against the unclaimed pitch times
+    # and hands every contested pitch time to its closest egg time
+    pending = np.arange(egg_times.size)
+    unclaimed = np.arange(pitch_times.size)
+    while pending.size and unclaimed.size:
+        nearest, diffs = nearest_times(egg_times[pending], pitch_times[unclaimed])
+        within = diffs < tol
+
+        if not within.any():
+            break
+
+        eggs = pending[within]
+        ptchs = unclaimed[nearest[within]]
+
+        # Order by difference (then egg index) and keep the first claim on each pitch
+        order = np.lexsort((eggs, diffs[within]))
+        __, first = np.unique(ptchs[order], return_index=True)
+        winners = order[first]
+
+        time_indices.append(eggs[winners])
+        ptch_indices.append(ptchs[winners])
+
+        losers = np.ones(eggs.size, dtype=bool)
+        losers[winners] = False
+        pending = eggs[losers]
+        unclaimed = np.setdiff1d(unclaimed, ptchs[winners], assume_unique=True)
+
+    if not time_indices:
+        return (np.array([], dtype=np.intp), np.array([], dtype=np.intp))
+
+    time_indices = np.concatenate(time_indices)
+    ptch_indices = np.concatenate(ptch_indices)
+
+    order = np.argsort(time_indices, kind='mergesort')
+
+    return (time_indices[order], ptch_indices[order])
+
+# Concatenates a list of one dimensional arrays (one per seed)
+#   Returns: (values, offsets) where seed i owns values[offsets[i]:offsets[i + 1]]
+def concatenate_segments(arrays, dtype=float):
+    arrays = [np.asarray(array, dtype=dtype).ravel() for array in arrays]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.intp)
+    np.cumsum([array.size for array in arrays], out=offsets[1:])
+
+    values = np.concatenate(arrays) if arrays else np.array([], dtype=dtype)
+
+    return (values, offsets)
+
+"""
+Finds the nearest pitch time of every egg time for many seeds in a single vectorized
+pass (as nearest_times does for a single seed). No neighbour ever crosses a seed boundary.
+    egg_times, egg_offsets: The concatenated egg times of every seed and the offsets
+        of each seed (as from concatenate_segments)
+    pitch_times, pitch_offsets: The same for the pitch times (with the same seeds)
+
+    Returns: (pitch_indices, diffs) for every egg time, where pitch_indices are global
+        (indices into the concatenated pitch times, -1 if the seed has no pitch times)
+        and diffs are the absolute time differences (inf if there is no pitch time)
+"""
+def nearest_times_segmented(egg_times, egg_offsets, pitch_times, pitch_offsets):
+    egg_times = np.asarray(egg_times, dtype=float)
+    pitch_times = np.asarray(pitch_times, dtype=float)
+    egg_offsets = np.asarray(egg_offsets, dtype=np.intp)
+    pitch_offsets = np.asarray(pitch_offsets, dtype=np.intp)
+
+    if egg_offsets.size != pitch_offsets.size:
+        sys.exit("Error: egg_offsets and pitch_offsets must cover the same seeds.")
+
+    n_eggs = egg_times.size
+    segments = np.arange(egg_offsets.size - 1, dtype=np.intp)
+
+    # Merge both sides sorted by seed then time. Egg times go before equal pitch times
+    # and equal pitch times keep their index order, as in nearest_times.
+    times = np.concatenate((egg_times, pitch_times))
+    seeds = np.concatenate((np.repeat(segments, np.diff(egg_offsets)), np.repeat(segments, np.diff(pitch_offsets))))
+    is_pitch = np.arange(times.size) >= n_eggs
+
+    order = np.lexsort((np.arange(times.size), is_pitch, times, seeds))
+    times, seeds, is_pitch = times[order], seeds[order], is_pitch[order]
+
+    # The closest pitch time on either side of every position in the merged order
+    positions = np.arange(times.size)
+    left = np.maximum.accumulate(np.where(is_pitch, positions, -1))
+    right = np.minimum.accumulate(np.where(is_pitch, positions, times.size)[::-1])[::-1]
+
+    eggs = np.flatnonzero(~is_pitch)
+    left, right = left[eggs], right[eggs]
+
+    # A neighbour from another seed (or past either end) is never a candidate
+    left_ok = left >= 0
+    left_ok[left_ok] = seeds[left[left_ok]] == seeds[eggs[left_ok]]
+    right_ok = right < times.size
+    right_ok[right_ok] = seeds[right[right_ok]] == seeds[eggs[right_ok]]
+
+    left_diff = np.full(eggs.size, np.inf)
+    left_diff[left_ok] = np.abs(times[left[left_ok]] - times[eggs[left_ok]])
+    right_diff = np.full(eggs.size, np.inf)
+    right_diff[right_ok] = np.abs(times[right[right_ok]] - times[eggs[right_ok]])
+
+    # Prefer the left neighbour on ties (it has the smaller time)
+    nearest = np.where(left_diff <= right_diff, left, right)
+    diffs = np.minimum(left_diff, right_diff)
+    found = np.isfinite(diffs)
+
+    # Move to the first of any run of equal pitch times (within the seed)
+    pitches = np.flatnonzero(is_pitch)
+    runs = np.ones(pitches.size, dtype=bool)
+    runs[1:] = (times[pitches[1:]] != times[pitches[:-1]]) | (seeds[pitches[1:]] != seeds[pitches[:-1]])
+    first = np.zeros(times.size, dtype=np.intp)
+    first[pitches] = pitches[np.maximum.accumulate(np.where(runs, np.arange(pitches.size), 0))]
+
+    ptch_indices = np.full(n_eggs, -1, dtype=np.intp)
+    ptch_indices[order[eggs[found]]] = order[first[nearest[found]]] - n_eggs
+
+    egg_diffs = np.empty(n_eggs)
+    egg_diffs[order[eggs]] = diffs
+
+    return (ptch_indices, egg_diffs)
+
+"""
+Matches the egg times of many seeds to their pitch times in a single vectorized pass.
+Every egg time takes its nearest pitch time of the same seed (as compare_times does
+for a single seed) and no match ever crosses a seed boundary.
+    egg_times, egg_offsets: The concatenated egg times of every seed and the offsets
+        of each seed (as from concatenate_segments)
+    pitch_times, pitch_offsets: The same for the pitch times (with the same seeds)
+    tol [default: 2e-4]: Largest time difference (s) allowed for a match
+
+    Returns: (egg_indices, pitch_indices) as global numpy integer arrays (indices into
+        the concatenated times) ordered by egg index
+"""
+def compare_times_segmented(egg_times, egg_offsets, pitch_times, pitch_offsets, tol=2e-4):
+    ptch_indices, diffs = nearest_times_segmented(egg_times, egg_offsets, pitch_times, pitch_offsets)
+    time_indices = np.flatnonzero(diffs < tol)
+
+    return (time_indices, ptch_indices[time_indices])
+
+# Returns the distance (s) from every egg time to its nearest pitch time for the given
+# seeds of data as (distances, offsets) where seed i owns distances[offsets[i]:offsets[i + 1]]
+# (inf for the egg times of a seed without pitch times)
+def nearest_distances(data, seeds=None):
+    if seeds is None:
+        seeds = list(data.keys())
+
+    egg_times, egg_offsets = concatenate_segments([data[seed]["candidates"]["candidates_0"]["StartTimeInAcq"] for seed in seeds])
+    pitch_times, pitch_offsets = concatenate_segments([data[seed]['pitch times'] for seed in seeds])
+
+    __, distances = nearest_times_segmented(egg_times, egg_offsets, pitch_times, pitch_offsets)
+
+    return (distances, egg_offsets)
+
+"""
+Counts the egg times matched (as by compare_times) for every one of a list of
+tolerances from the nearest pitch time distances in a single cumulative pass
+    data: Dictionary keyed by seed with the candidates and the pitch times of every seed
+    tolerances: A list of tolerances (s)
+    bins [default: None]: The bin edges of the distance histogram. By default 50
+        bins from 0 to the largest tolerance
+
+    Returns: (table, total, histogram)
+        table: A pandas DataFrame indexed by seed with one column of matched counts per tolerance
+        total: A pandas Series of the matched counts of all seeds per tolerance
+        histogram: (counts, edges) of the nearest pitch time distances of all seeds
+"""
+def tolerance_sweep(data, tolerances, bins=None):
+    seeds = list(data.keys())
+    tolerances = np.asarray(tolerances, dtype=float)
+
+    distances, offsets = nearest_distances(data, seeds)
+    seed_ids = np.repeat(np.arange(len(seeds)), np.diff(offsets))
+
+    # A distance is matched by tolerance j when it falls in a bin at or below j
+    order = np.argsort(tolerances, kind='mergesort')
+    tol_bins = np.searchsorted(tolerances[order], distances, side='right')
+
+    n_bins = tolerances.size + 1
+    counts = np.bincount(seed_ids * n_bins + tol_bins, minlength=len(seeds) * n_bins)
+    counts = np.cumsum(counts.reshape(len(seeds), n_bins), axis=1)[:, :-1]
+
+    matched = np.empty_like(counts)
+    matched[:, order] = counts
+
+    table = pd.DataFrame(matched, index=pd.Index(seeds, name='seed'), columns=tolerances)
+    total = table.sum(axis=0)
+
+    if bins is None:
+        bins = np.linspace(0, tolerances.max() if tolerances.size else 1.0, 51)
+
+    histogram = np.histogram(distances[np.isfinite(distances)], bins)
+
+    return (table, total, histogram)
 
 """
 Finds the percentage of events successfully found through Katydid
@@ -105,9 +421,13 @@ Finds the percentage of events successfully found through Katydid
         depending on the egg_type
 
     egg_type [string]: 'h5' or 'root'
-        By default egg_type = 'h5'
+        By default egg_type = 'h5'. Root files are counted from their sidecars
+        (see rootcache.py) which are converted once with PyROOT when missing or stale
+
+    manifest [default: None]: A path to a seed manifest file (or a SeedManifest).
+        Counts of unchanged seeds are taken from it and new counts are recorded.
 """
-def test_event_processing(pitch_angles=None, eggs=None, egg_type='h5'):
+def test_event_processing(pitch_angles=None, eggs=None, egg_type='h5', manifest=None):
 
     pitch_angle_dir = "./data/pitch_angles"
 
@@ -123,7 +443,7 @@ def test_event_processing(pitch_angles=None, eggs=None, egg_type='h5'):
         pitch_angles = [os.path.join(pitch_angle_dir, fn) for fn in os.listdir(pitch_angle_dir)]
 
     if eggs is None:
-        eggs = [os.path.join(egg_dir, fn) for fn in os.listdir(egg_dir)]
+        eggs = [os.path.join(egg_dir, fn) for fn in os.listdir(egg_dir) if fn.endswith(SEED_FILE_TYPES[egg_type])]
 
     # Single File Parameter Handling --> turn string into list unless it's a dir
     if isinstance(pitch_angles, str):
@@ -134,7 +454,7 @@ def test_event_processing(pitch_angles=None, eggs=None, egg_type='h5'):
 
     if isinstance(eggs, str):
         if os.path.isdir(eggs):
-            eggs = [os.path.join(eggs, fn) for fn in os.listdir(eggs)]
+            eggs = [os.path.join(eggs, fn) for fn in os.listdir(eggs) if fn.endswith(SEED_FILE_TYPES[egg_type])]
         else:
             eggs = [eggs]
 
@@ -155,64 +475,89 @@ def test_event_processing(pitch_angles=None, eggs=None, egg_type='h5'):
     if len(pitch_angles) == 1:
         single_file = True
 
-    # Iterate through the pitch angle seed values and look for egg
-    # files that have the appropriate seed value
+    # Keep the manifest open for every seed rather than reopening it per seed
+    if isinstance(manifest, str):
+        with seedmanifest.SeedManifest(manifest) as manifest:
+            return test_event_processing(pitch_angles, eggs, egg_type, manifest)
+
+    counts = ['simulated', 'detected']
+
+    # Pair the pitch angle and egg files by their exact seed value
+    # (one pass over each list rather than a search per pitch file)
+    egg_index = index_files(eggs)
+
     total_events = 0
     total_events_detected = 0
-    for pitch_angle in pitch_angles:
-        pitch_seed = extract_seed(pitch_angle)
-
-        for egg in eggs:
-            # If a match is found then compared
-            # the events and move on to the next seed
-            egg_match = re.search(pitch_seed, egg)
-
-            if egg_match is not None:
-                # Note: variable 'angle_events' is actually time data
-                # but the physicality of the data is completely irrelevant
-                # and this nomeclature is better.
-
-                # Read the angle file
-                angle_events, __ = get_pitch_data(pitch_angle)
-
-                # Read the egg file (depends on egg_type)
-                egg_events = None
-                if egg_type == 'h5':
-                    group = "candidates"
-                    dataset = "candidates_0"
-                    variables = ["EventID"]
-                    data = fetch_variables_hdf5(egg, group, dataset, variables)
-
-                    if data == -1:
-                        sys.stderr.write("Could not fetch {} from {}\n".format(variables, egg))
-                        break
-
-                    # If EventID not found variables will return as empty
-                    if len(variables) > 0:
-                        egg_events = data[variables[0]]
-                    else:
-                        sys.stderr.write('No EventID found in {}\n'.format(egg))
-                else:
-                    sys.stderr.write('Root implemetation not available\n')
-
-                if egg_events is not None:
-                    a = len(angle_events)
-                    e = len(egg_events)
-                    print("{}: {}/{} events detected ({}%).".format(pitch_seed, e, a, (e/a)*100))
-
-                    total_events+=a
-                    total_events_detected+=e
-
-                # Remove the file name from the group of eggs
-                eggs.remove(egg)
-
-                # Found a valid egg file so leave regardless of outcome
-                break
+    for pitch_seed, pitch_angle in index_files(pitch_angles).items():
+        egg = egg_index.get(pitch_seed)
+
+        if egg is None:
+            continue
+
+        if egg_type == 'h5' and manifest is not None:
+            entries = manifest.get(pitch_seed, (egg, pitch_angle), counts)
+
+            if entries is not None:
+                a = int(entries['simulated'])
+                e = int(entries['detected'])
+                print("{}: {}/{} events detected ({}%).".format(pitch_seed, e, a, (e/a)*100))
+
+                total_events+=a
+                total_events_detected+=e
+                continue
+
+        # Note: variable 'angle_events' is actually time data
+        # but the physicality of the data is completely irrelevant
+        # and this nomeclature is better.
+
+        # Read the angle file
+        angle_events, __ = get_pitch_data(pitch_angle)
+
+        # Read the egg file (depends on egg_type)
+        egg_events = None
+        if egg_type == 'h5':
+            group = "candidates"
+            dataset = "candidates_0"
+            variables = ["EventID"]
+            data = fetch_variables_hdf5(egg, group, dataset, variables)
+
+            if data == -1:
+                sys.stderr.write("Could not fetch {} from {}\n".format(variables, egg))
+                continue
+
+            # If EventID not found variables will return as empty
+            if len(variables) > 0:
+                egg_events = data[variables[0]]
+            else:
+                sys.stderr.write('No EventID found in {}\n'.format(egg))
+        else:
+            # The multi track events come from the root file's sidecar (converted once, see rootcache.py)
+            n_events = rootcache.count_events(egg)
+
+            if n_events == -1:
+                sys.stderr.write("Could not fetch the multiTrackEvents from {}\n".format(egg))
+                continue
+
+            egg_events = np.arange(n_events)
+
+        if egg_events is not None:
+            a = len(angle_events)
+            e = len(egg_events)
+            print("{}: {}/{} events detected ({}%).".format(pitch_seed, e, a, (e/a)*100))
+
+            total_events+=a
+            total_events_detected+=e
+
+            if manifest is not None and egg_type == 'h5':
+                manifest.record(pitch_seed, (egg, pitch_angle), {'simulated': a, 'detected': e})
 
     if total_events > 0 and not single_file:
         event_detect_prcnt = (total_events_detected / total_events) * 100
         print("Total Events Detected: {}/{} ({}%)".format(total_events_detected, total_events, event_detect_prcnt))
 
+# Regex to capture seed (all of its digits so Seed10 never matches Seed100)
+_seed_regx = re.compile(r'.*(?P<seed>Seed\d+)')
+
 # Given a string this method searches through the contents and extracts
 # any string with a 'SeedXXX' in it and returns this as the result or None
 # if no string can be found.
@@ -225,10 +570,7 @@ def extract_seed(string):
 
         sys.exit("Error: Argument 'string' must be a single string")
 
-    # Regex to capture seed
-    seed_regx = re.compile(r'.*(?P<seed>Seed\d{0,3}).*')
-
-    match = seed_regx.search(string)
+    match = _seed_regx.search(string)
 
     # Add the captured named group ('seed') to the seeds list
     seed = None
@@ -265,9 +607,6 @@ def extract_dirSeeds(dir):
     if not os.path.isdir(dir):
         sys.exit("Error: {} is not a valid directory. Exiting.".format(dir))
 
-    # Run through the directory and extract the seed value for each file
-    seed_regx = re.compile(r'.*(?P<seed>Seed\d{0,3}).*') # Regex to capture seed
-
     # Gather the contents of the directory into a list
     files = os.listdir(dir)
 
@@ -276,6 +615,49 @@ def extract_dirSeeds(dir):
 
     return seeds
 
+# Given a list of file names returns a dictionary of seed -> file name (in the order
+# given) for every file with a 'SeedXXX' in its name
+def index_files(files):
+    index = dict()
+    for fn in files:
+        seed = extract_seed(fn)
+
+        if seed is not None:
+            index[seed] = fn
+
+    return index
+
+# The file extension of each kind of file found by index_seeds
+SEED_FILE_TYPES = {'h5': '.h5', 'root': '.root', 'pitch': '.txt'}
+
+"""
+Scans each directory once and returns a dictionary of seed -> {kind: file name}
+where kind is 'h5', 'root' or 'pitch'. A kind is left out of a seed's entry if
+there is no file of that kind for the seed (or its directory is None).
+    h5_dir [default: None]: The processed egg hdf5 directory
+    root_dir [default: None]: The processed egg root directory
+    pitch_dir [default: None]: The pitch angle directory
+
+    i.e.) index_seeds(h5_dir, pitch_dir=pitch_dir)['Seed100']
+            --> {'h5': '.../Seed100.h5', 'pitch': '.../pitchangles_Seed100.txt'}
+"""
+def index_seeds(h5_dir=None, root_dir=None, pitch_dir=None):
+    dirs = {'h5': h5_dir, 'root': root_dir, 'pitch': pitch_dir}
+
+    index = dict()
+    for kind, dir in dirs.items():
+        if dir is None:
+            continue
+
+        if not os.path.isdir(dir):
+            sys.exit("Error: {} is not a valid directory. Exiting.".format(dir))
+
+        fns = sorted(fn for fn in os.listdir(dir) if fn.endswith(SEED_FILE_TYPES[kind]))
+        for seed, fn in index_files(fns).items():
+            index.setdefault(seed, dict())[kind] = os.path.join(dir, fn)
+
+    return dict((seed, index[seed]) for seed in sorted(index))
+
 """
 Converts an h5 file, or list or dict of h5 files to
 a python dictionary object.
@@ -286,8 +668,13 @@ a python dictionary object.
         previous case
     - If a dict is given the then keys for each file name will
         be used as the key for the dictionary
+
+    lazy [default: True]: If True each file is returned as a h5tree.LazyGroup
+        which reads a dataset only the first time it is accessed, memoizes it in
+        a size bounded cache and shares a small pool of open file handles. If
+        False every group and dataset is read into nested dictionaries.
 """
-def h5todict(h5files):
+def h5todict(h5files, lazy=True):
 
     # If the argument is a string convert to list
     if isinstance(h5files, str):
@@ -317,19 +704,13 @@ def h5todict(h5files):
 
     h5dict = dict()
     for h5file, key in zip(h5files, keys):
-        h5fdict = dict()
+        if lazy:
+            h5dict.update({key: h5tree.LazyGroup(h5file)})
+            continue
 
         # Open the h5 file and store the contents into a dictionary for the h5 file
         with h5.File(h5file, 'r') as h5f:
-            for name, h5_obj in h5f.items():
-
-                # Recurse on Groups
-                if isinstance(h5_obj, h5.Group):
-                    h5fdict.update({name: _h5grp2dct(h5_obj)})
-                # Update on Datasets
-                elif isinstance(h5_obj, h5.Dataset):
-                    ds = np.array(h5_obj.get(name))
-                    h5fdict.update({name:ds})
+            h5fdict = _h5grp2dct(h5f)
 
         # Update the master dictionary with the h5 files dictionary
         h5dict.update({key: h5fdict})
@@ -341,10 +722,12 @@ def _h5grp2dct(h5grp_obj):
     h5dict = dict()
 
     for name, h5_obj in h5grp_obj.items():
+        # Recurse on Groups
         if isinstance(h5_obj, h5.Group):
-            h5grp2dct(h5grp_obj)
+            h5dict.update({name: _h5grp2dct(h5_obj)})
+        # Update on Datasets
         elif isinstance(h5_obj, h5.Dataset):
-            ds = np.array(h5grp_obj.get(name))
+            ds = np.array(h5_obj)
             h5dict.update({name:ds})
 
     return h5dict
@@ -368,14 +751,122 @@ or the entire h5/pitch angle directory.
         A boolean to decide whether or not to run the method
         test_event_processing on the files found during processing.
 
+    workers [default: 1]
+        The number of processes used to load and filter the seeds. With more
+        than one worker each seed is handled independently in a process pool
+        and the results are merged back in seed order. None uses every core.
+
+    cache [default: None]
+        A path to a consolidated seed cache file (see seedcache.py). If given the
+        cache is first brought up to date (only new or changed seeds are read from
+        their source files) and every seed is then loaded from the cache. The cache
+        is read and filtered in this process, so workers is not used with it.
+
+    pitch_cache [default: None]
+        A path to a binary (.npz) cache of every pitch angle file (see load_pitch_data).
+        If the pitch angle files are unchanged since it was written the pitch data is
+        loaded from it instead of parsing the text files. Not used with cache, which
+        keeps the pitch data itself.
+
+    manifest [default: None]
+        A path to a seed manifest file (see seedmanifest.py) or a SeedManifest. Seeds whose source
+        files have not changed since they were last recorded get their filtered
+        results from the manifest, only new or changed seeds are loaded and filtered,
+        and their results are recorded for the next run.
+
     Returns: (seeds, files, data)
-        seeds: A list of seed values processed from the two directories
+        seeds: A sorted list of seed values processed from the two directories
         files: A list of tuples of (h5_files, pitch_files) processed from the two directories
         data: A dictionary result from calling h5todict on the h5_files used
 """
-def process_files(h5_seeds=None, pitch_seeds=None, pitch_angle_dir=None, h5_dir=None, test=False):
+def process_files(h5_seeds=None, pitch_seeds=None, pitch_angle_dir=None, h5_dir=None, test=False, workers=1, cache=None, manifest=None, pitch_cache=None):
     # Set all the parameter values
 
+    if isinstance(manifest, str):
+        manifest = seedmanifest.SeedManifest(manifest)
+
+    seeds, files = _find_files(h5_seeds, pitch_seeds, pitch_angle_dir, h5_dir)
+
+    h5_files = [file[0] for file in files]
+    pitch_files = [file[1] for file in files]
+
+    # Test the Katydid processing
+    if test:
+        if manifest is not None:
+            with manifest:
+                test_event_processing(copy(pitch_files), copy(h5_files), manifest=manifest)
+        else:
+            test_event_processing(copy(pitch_files), copy(h5_files))
+
+    # Seeds already in the manifest only need their raw data opened (lazily) and
+    # their stored results put back. Everything else is processed below. The
+    # manifest is opened once for the lookups and once for the recording below
+    # (it is never held open while the seeds are processed, i.e. in forked workers).
+    restored = dict()
+    if manifest is not None:
+        with manifest:
+            for seed, (h5_file, pitch_file) in zip(seeds, files):
+                entries = manifest.get(seed, (h5_file, pitch_file))
+                if entries is not None:
+                    restored[seed] = manifest.restore(h5todict([h5_file])[seed], entries)
+
+    todo = [(seed, fls) for seed, fls in zip(seeds, files) if seed not in restored]
+    todo_seeds = [seed for seed, __ in todo]
+    todo_files = [fls for __, fls in todo]
+
+    # Load each seed's h5 and pitch angle data and filter it with the standard
+    # filters (i.e. time matching). One can add custom filters or filter the data
+    # at any point using the method filter_data and creating an appropriate filter method
+    data = dict()
+    if not todo:
+        pass
+    elif cache is not None:
+        if workers != 1:
+            sys.stderr.write("Warning: workers is not used with a cache, the seeds are loaded in this process.\n")
+
+        seedcache.build_cache(cache, seeds, files)
+        data = filter_data(seedcache.load_cache(cache, todo_seeds))
+    elif workers == 1:
+        pitch = _load_todo_pitch(pitch_files, todo_files, pitch_cache)
+
+        for seed, (h5_file, pitch_file) in zip(todo_seeds, todo_files):
+            data.update(_process_seed(h5_file, pitch_file, pitch=pitch.seed(seed)))
+    else:
+        # Without a pitch cache every worker parses its own pitch angle file
+        pitch = [None] * len(todo)
+        if pitch_cache is not None:
+            pitch_data = _load_todo_pitch(pitch_files, todo_files, pitch_cache)
+            pitch = [pitch_data.seed(seed) for seed in todo_seeds]
+
+        # Pooled file handles must not be shared with the forked workers
+        h5tree.close_files()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for seed_data in pool.map(_process_seed, *zip(*todo_files), [None] * len(todo), pitch):
+                data.update(seed_data)
+
+    if manifest is not None:
+        with manifest:
+            for seed, fls in zip(todo_seeds, todo_files):
+                manifest.record(seed, fls, manifest.results(data[seed]))
+
+        data.update(restored)
+        data = dict((seed, data[seed]) for seed in seeds)
+
+    return (seeds, files, data)
+
+# Loads the pitch data of the seeds left to process. With a pitch cache every pitch
+# file is loaded so the cache holds the same files from run to run (a manifest
+# changes which seeds are left) and is only rewritten when a pitch file changes.
+def _load_todo_pitch(pitch_files, todo_files, pitch_cache=None):
+    if pitch_cache is not None:
+        return load_pitch_data(pitch_files, cache=pitch_cache)
+
+    return load_pitch_data([pitch_file for __, pitch_file in todo_files])
+
+# Finds the seeds and the (h5_file, pitch_file) pairs processed by process_files
+# and iter_seeds after checking the assumptions on the directories
+def _find_files(h5_seeds, pitch_seeds, pitch_angle_dir, h5_dir):
     # Use the default directories
     if pitch_angle_dir is None:
         pitch_angle_dir = "./data/pitch_angles"
@@ -385,19 +876,21 @@ def process_files(h5_seeds=None, pitch_seeds=None, pitch_angle_dir=None, h5_dir=
 
     # Check assumptions for the given files (assumes directories are given rather than seeds)
     # Any and all herecy is punished with removal from the directory!
-    check_assumptions(hdf5_dir=h5_dir, pitch_dir=pitch_angle_dir)
+    check_assumptions(hdf5_dir=h5_dir, root_dir=False, pitch_dir=pitch_angle_dir)
+
+    index = index_seeds(h5_dir=h5_dir, pitch_dir=pitch_angle_dir)
 
     if h5_seeds is None:
-        h5_seeds = extract_dirSeeds(h5_dir)
+        h5_seeds = [seed for seed, fns in index.items() if 'h5' in fns]
 
     if pitch_seeds is None:
-        pitch_seeds = extract_dirSeeds(pitch_angle_dir)
+        pitch_seeds = [seed for seed, fns in index.items() if 'pitch' in fns]
 
     print('Processing files in {} and {}'.format(h5_dir, pitch_angle_dir))
 
 
     # Construct a list of seed values found ONLY in both directories
-    seeds = list(set(h5_seeds + pitch_seeds))
+    seeds = sorted(set(h5_seeds + pitch_seeds))
     for pitch_seed in pitch_seeds:
         if pitch_seed not in h5_seeds:
             print("Warning: {} found in {}, but not found {}".format(pitch_seed, pitch_angle_dir, h5_dir))
@@ -409,35 +902,56 @@ def process_files(h5_seeds=None, pitch_seeds=None, pitch_angle_dir=None, h5_dir=
     # which will be used to generate the data
     files = list()
     for seed in seeds:
-        h5_fmt = os.path.join(h5_dir, "{}.h5".format(seed))
-        pitch_angl_fmt = os.path.join(pitch_angle_dir, "pitchangles_{}.txt".format(seed))
+        fns = index.get(seed, dict())
+        h5_fmt = fns.get('h5', os.path.join(h5_dir, "{}.h5".format(seed)))
+        pitch_angl_fmt = fns.get('pitch', os.path.join(pitch_angle_dir, "pitchangles_{}.txt".format(seed)))
 
         files.append((h5_fmt, pitch_angl_fmt))
 
-    h5_files = [file[0] for file in files]
-    pitch_files = [file[1] for file in files]
+    return (seeds, files)
 
-    # Test the Katydid processing
-    if test:
-        test_event_processing(copy(pitch_files), copy(h5_files))
+"""
+Yields the data of one seed at a time (loaded and filtered exactly as process_files
+does) so an analysis over many seeds only ever holds a single seed in memory.
+The parameters h5_seeds, pitch_seeds, pitch_angle_dir and h5_dir are the same as
+for process_files.
+    filters [default: None]: The filters handed to filter_data for every seed
+    pitch_cache [default: None]: A pitch angle cache as for process_files
+
+    Yields: (seed, files, seed_data)
+        seed: The seed value (i.e. 'Seed100')
+        files: The (h5_file, pitch_file) tuple of the seed
+        seed_data: The filtered data of the seed (i.e. data[seed] of process_files)
+
+    The records can be reduced in a single pass with reducers.reduce_seeds.
+"""
+def iter_seeds(h5_seeds=None, pitch_seeds=None, pitch_angle_dir=None, h5_dir=None, filters=None, pitch_cache=None):
+    seeds, files = _find_files(h5_seeds, pitch_seeds, pitch_angle_dir, h5_dir)
 
-    # Generate the unfiltered data from the h5_files
-    data = h5todict(h5_files)
+    # The pitch data of every seed is small next to its h5 data, so with a cache it is all loaded at once
+    pitch = None
+    if pitch_cache is not None:
+        pitch = load_pitch_data([pitch_file for __, pitch_file in files], cache=pitch_cache)
 
-    # Add the pitch angle data
-    for pitch_file in pitch_files:
-        pitch_seed = extract_seed(pitch_file)
+    for seed, (h5_file, pitch_file) in zip(seeds, files):
+        data = _process_seed(h5_file, pitch_file, filters, None if pitch is None else pitch.seed(seed))
 
-        times, pitch_angles = get_pitch_data(pitch_file)
+        yield (seed, (h5_file, pitch_file), data[seed])
 
-        data[pitch_seed].update({'pitch times': times, 'pitch angles': pitch_angles})
+# Loads the h5 and pitch angle data of a single seed and applies the standard
+# filters (or the filters given). Returns a single entry data dictionary keyed by the seed.
+#   pitch [default: None]: The (times, pitch_angles) of the seed if already loaded
+def _process_seed(h5_file, pitch_file, filters=None, pitch=None):
+    data = h5todict([h5_file])
 
-    # Filter the data with standard filters (i.e. time matching). One can add custom
-    # filters or filter the data at any point using the method filter_data and creating
-    # an appropriate filter method
-    data = filter_data(data)
+    pitch_seed = extract_seed(pitch_file)
+    if pitch is None:
+        pitch = get_pitch_data(pitch_file)
+    times, pitch_angles = pitch
 
-    return (seeds, files, data)
+    data[pitch_seed].update({'pitch times': times, 'pitch angles': pitch_angles})
+
+    return filter_data(data, filters)
 
 """
 Filters the data dictionary given by the list of methods provided.
@@ -464,68 +978,61 @@ def filter_data(data, filters=None):
 
     return data
 
-def filter_times(data):
+# Matches the egg times of every seed to its pitch times and keeps only the matched data
+#   optimal [default: False]: Use the optimal assignment of compare_times
+def filter_times(data, optimal=False):
 
     # Highest level of data dict is always SeedXXX keys
-    seeds = data.keys();
-    for seed in seeds:
+    seeds = list(data.keys())
+
+    group = "candidates"
+    dataset = "candidates_0"
+    egg_time_name = "StartTimeInAcq"
+
+    # Match every seed at once (the optimal assignment is solved seed by seed)
+    if not optimal:
+        egg_times, egg_offsets = concatenate_segments([data[seed][group][dataset][egg_time_name] for seed in seeds])
+        pitch_times, pitch_offsets = concatenate_segments([data[seed]['pitch times'] for seed in seeds])
+
+        all_egg_indices, all_pitch_indices = compare_times_segmented(egg_times, egg_offsets, pitch_times, pitch_offsets)
+        bounds = np.searchsorted(all_egg_indices, egg_offsets)
+
+    for i, seed in enumerate(seeds):
         # Get the current seeds data
         seed_data = data[seed]
 
         # Get the relevant time information from the h5 section of the data
-        group = "candidates"
-        dataset = "candidates_0"
         h5_candidates_0 = seed_data[group][dataset]
 
-        egg_time_name = "StartTimeInAcq"
-        egg_times = h5_candidates_0[egg_time_name] # Create function to fetch data safely
-
-        # Get the pitch times
-        pitch_times = seed_data['pitch times']
+        # Get the matched indices for the data (local to the seed)
+        if optimal:
+            egg_times = h5_candidates_0[egg_time_name] # Create function to fetch data safely
+            egg_indices, pitch_indices = compare_times(egg_times, seed_data['pitch times'], optimal=True)
+        else:
+            egg_indices = all_egg_indices[bounds[i]:bounds[i + 1]] - egg_offsets[i]
+            pitch_indices = all_pitch_indices[bounds[i]:bounds[i + 1]] - pitch_offsets[i]
 
-        # Get the matched indices for the data
-        egg_indices, pitch_indices = compare_times(egg_times, pitch_times)
+        # Keep the matched indices so the matching can be traced (or restored) later
+        seed_data['egg indices'] = egg_indices
+        seed_data['pitch indices'] = pitch_indices
 
         # Filter the data and update the dictionary to only have values at the appropriate
         # egg and pitch indices
         filtered_extension = "_"
 
         # All pitch angle data should be filtered by pitch indices
-        items = list(seed_data.items())
-        for key, item in items:
-            if key == 'pitch times' or key == 'pitch angles':
-                new_key = key + filtered_extension
-                seed_data[new_key] = [item[p] for p in pitch_indices]
+        for key in ['pitch times', 'pitch angles']:
+            if key in seed_data:
+                seed_data[key + filtered_extension] = np.asarray(seed_data[key])[pitch_indices]
 
         # All hdf5 data should be filtered by egg indices
         # Note: This only filters data in data hierarchy:
         #       ... > candidates > candidates_0 > ...
         #       Also note, that hdf5_data is a np.ndarray object, not a dictionary
 
-        # Get all the names of data in the np.ndarray object
-        dt = h5_candidates_0.dtype
-        names = dt.names
-        shape = h5_candidates_0.shape
-
-        # Copy the attributes of the unfiltered ndarray
-        dt_fltrd = deepcopy(dt)
-        shape_fltrd = (len(egg_indices),)
-
-        # Rename the names
-        dt_fltrd.names = [name + filtered_extension for name in dt_fltrd.names]
-        names_fltrd = dt_fltrd.names
-
-        # Instantiate a zeroed ndarry for filtered data
-        filtered_ndarray = np.zeros(shape_fltrd, dt_fltrd)
-
-        # Populate the filtered ndarray
-        for name, new_name in zip(names, names_fltrd):
-            values = h5_candidates_0[name]
-            filtered_ndarray[new_name] = [values[e] for e in egg_indices]
-
-        # In case one wishes to see the new time data
-        # print(filtered_ndarray[egg_time_name + '_'])
-        # print(seed_data['pitch times_'])
+        # Gather the matched rows in one go and rename the fields through a view
+        # of the same memory (only the names change, the layout is identical)
+        filtered_ndarray = h5_candidates_0[egg_indices].view(_filtered_dtype(h5_candidates_0.dtype, filtered_extension))
 
         # Rename the dataset and update the seed_data with the filtered array
         new_dataset = dataset + filtered_extension
@@ -536,6 +1043,58 @@ def filter_times(data):
 
     return data
 
+# Returns the number of egg times whose match differs between two matchings, i.e. egg
+# times matched to another pitch time or matched in only one of the two
+#   first, second: (egg_indices, pitch_indices) as returned by compare_times
+def count_changed_matches(first, second):
+    egg_first, ptch_first = first
+    egg_second, ptch_second = second
+
+    common, in_first, in_second = np.intersect1d(egg_first, egg_second, assume_unique=True, return_indices=True)
+    moved = np.count_nonzero(ptch_first[in_first] != ptch_second[in_second])
+
+    return int(egg_first.size + egg_second.size - 2 * common.size + moved)
+
+"""
+Compares the greedy matching of compare_times to the optimal assignment for every seed
+    data: Dictionary keyed by seed with the candidates and the pitch times of every seed
+    tol [default: 2e-4]: Largest time difference (s) allowed for a match
+
+    Returns: (table, total)
+        table: A pandas DataFrame with one row per seed and the columns seed, greedy and
+            optimal (the number of matches of each mode) and changed (count_changed_matches)
+        total: A dictionary with the same keys for all seeds combined
+"""
+def compare_matching(data, tol=2e-4):
+    rows = list()
+    for seed, seed_data in data.items():
+        egg_times = seed_data["candidates"]["candidates_0"]["StartTimeInAcq"]
+        pitch_times = seed_data['pitch times']
+
+        greedy = compare_times(egg_times, pitch_times, tol=tol)
+        optimal = compare_times(egg_times, pitch_times, tol=tol, optimal=True)
+
+        rows.append((seed, greedy[0].size, optimal[0].size, count_changed_matches(greedy, optimal)))
+
+    table = pd.DataFrame(rows, columns=['seed', 'greedy', 'optimal', 'changed'])
+
+    total = {'seed': 'Total'}
+    for column in ['greedy', 'optimal', 'changed']:
+        total[column] = int(table[column].sum())
+
+    return (table, total)
+
+# Returns a copy of a structured dtype with the extension appended to every field
+# name while keeping the formats, offsets and itemsize (so it can be used as a view)
+def _filtered_dtype(dt, extension):
+    names = dt.names
+    fields = [dt.fields[name] for name in names]
+
+    return np.dtype({'names': [name + extension for name in names],
+                     'formats': [field[0] for field in fields],
+                     'offsets': [field[1] for field in fields],
+                     'itemsize': dt.itemsize})
+
 # Given any file name (pitch angle, root, or hdf5) extract the seed
 # and remove or label the corresponding files in the other directories
 #
@@ -597,7 +1156,11 @@ def punish_invalid_files(file, remove=True, label=False):
 
 # Ensures any assumptions made through the analysis process
 # do not propogate through the data
-def check_assumptions(hdf5_dir=None, root_dir=None, pitch_dir=None):
+#   Only the metadata and headers of the files are inspected, the files are checked
+#   concurrently by a pool of worker threads and every verdict is remembered until
+#   the file changes (see validate_file and VERDICTS_FILE). Directories which do not
+#   exist are skipped with a warning and a directory given as False is not checked.
+def check_assumptions(hdf5_dir=None, root_dir=None, pitch_dir=None, workers=8):
     home_dir = "/Users/josh_swerdlow/Documents/College/Senior_Year/First_Semester/thesis/classifier"
 
     if hdf5_dir is None:
@@ -609,20 +1172,95 @@ def check_assumptions(hdf5_dir=None, root_dir=None, pitch_dir=None):
     if pitch_dir is None:
         pitch_dir = os.path.join(home_dir, "data/pitch_angles")
 
-    # C H E C K  H D F 5  F I L E S
-    hdf5_files = [os.path.join(hdf5_dir, fn) for fn in os.listdir(hdf5_dir)]
+    # C H E C K  H D F 5,  R O O T  A N D  P I T C H  A N G L E  F I L E S
+    dirs = {'h5_dir': hdf5_dir, 'root_dir': root_dir, 'pitch_dir': pitch_dir}
+    dirs = dict((key, dir) for key, dir in dirs.items() if dir is not False)
+    for key, dir in sorted(dirs.items()):
+        if not os.path.isdir(dir):
+            sys.stderr.write("Warning: {} '{}' is not a valid directory. Its files are not checked.\n".format(key, dir))
+
+    dirs = dict((key, dir) for key, dir in dirs.items() if os.path.isdir(dir))
+    if not dirs:
+        sys.stderr.write("Warning: No files were checked.\n")
+        return
+
+    index = index_seeds(**dirs)
+
+    checks = [(fn, kind) for fns in index.values() for kind, fn in fns.items()]
+
+    for dir in dirs.values():
+        load_verdicts(dir)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        verdicts = list(pool.map(validate_file, *zip(*checks))) if checks else list()
+
+    # Punishing a file removes every file of its seed so only punish once per seed
+    punished = set()
+    for (fn, kind), valid in zip(checks, verdicts):
+        seed = extract_seed(fn)
+
+        if not valid and seed not in punished:
+            punished.add(seed)
+            punish_invalid_files(fn, remove=True)
+
+    for dir in dirs.values():
+        save_verdicts(dir)
 
-    for hdf5_file in hdf5_files:
-        if not validate_hdf5(hdf5_file):
-            punish_invalid_files(hdf5_file, remove=True)
+# Verdicts of validate_file keyed by (absolute file name, kind) -> (fingerprint, verdict)
+_verdicts = dict()
 
+# Name of the file next to the data in which the verdicts of a directory are kept
+# between runs as {file name: {kind: [mtime_ns, size, verdict]}}
+VERDICTS_FILE = '.seed_verdicts.json'
 
-    # C H E C K  R O O T  F I L E S
+# Validates a file of the given kind ('h5', 'root' or 'pitch'). The verdict is
+# cached and reused for as long as the file's fingerprint (mtime and size) is unchanged.
+def validate_file(fn, kind):
+    fp = seedcache.fingerprint(fn)
+    key = (os.path.abspath(fn), kind)
 
-    # C H E C K  P I T C H  A N G L E  F I L E S
+    cached = _verdicts.get(key)
+    if cached is not None and cached[0] == fp:
+        return cached[1]
+
+    verdict = VALIDATORS[kind](fn)
+    _verdicts[key] = (fp, verdict)
+
+    return verdict
+
+# Adds the verdicts saved in a directory's VERDICTS_FILE (if any) to the cache
+def load_verdicts(dir):
+    try:
+        with open(os.path.join(dir, VERDICTS_FILE), 'r') as f:
+            saved = json.load(f)
+    except (IOError, ValueError):
+        return
+
+    dir = os.path.abspath(dir)
+    for fn, kinds in saved.items():
+        for kind, (mtime_ns, size, verdict) in kinds.items():
+            _verdicts.setdefault((os.path.join(dir, fn), kind), ((mtime_ns, size), verdict))
+
+# Writes the cached verdicts of the files still in a directory to its VERDICTS_FILE
+def save_verdicts(dir):
+    dir = os.path.abspath(dir)
+
+    saved = dict()
+    for (fn, kind), (fp, verdict) in _verdicts.items():
+        if os.path.dirname(fn) == dir and os.path.isfile(fn):
+            saved.setdefault(os.path.basename(fn), dict())[kind] = list(fp) + [verdict]
+
+    verdicts_file = os.path.join(dir, VERDICTS_FILE)
+    try:
+        with open(verdicts_file + '.tmp', 'w') as f:
+            json.dump(saved, f, sort_keys=True)
+
+        os.replace(verdicts_file + '.tmp', verdicts_file)
+    except OSError:
+        sys.stderr.write("Warning: Could not save the verdicts to '{}'.\n".format(verdicts_file))
 
 # Validate an hdf5 file to ensure it has the necessary data hierarchy
-# and the necessary variables
+# and the necessary variables (only the names and dtypes are read)
 def validate_hdf5(hf):
 
     group1 = "candidates"
@@ -639,17 +1277,64 @@ def validate_hdf5(hf):
     variables = [variables1, variables2]
 
     # Iterate through the data hierarchy to check for all the variables
-    # If this fails anywhere break and return False else return True
-    valid = True
-    for grp, ds, var in zip(groups, datasets, variables):
-        data = fetch_variables_hdf5(hf, grp, ds, var)
-
-        if data == -1:
-            valid = False
-            break
+    # If this fails anywhere return False else return True
+    try:
+        with h5.File(hf, 'r') as h5f:
+            for grp, ds, var in zip(groups, datasets, variables):
+                obj = h5f.get(grp + '/' + ds)
+
+                if not isinstance(obj, h5.Dataset):
+                    sys.stderr.write("'{}' has no dataset: {}/{}.\n".format(hf, grp, ds))
+                    return False
+
+                missing = [v for v in var if v not in (obj.dtype.names or ())]
+                if missing:
+                    sys.stderr.write("'{}' is missing {} in {}/{}.\n".format(hf, missing, grp, ds))
+                    return False
+    except OSError:
+        sys.stderr.write("'{}' is not a readable hdf5 file.\n".format(hf))
+        return False
+
+    return True
+
+# Validate a root file by its magic number (every ROOT file starts with 'root')
+def validate_root(fn):
+    try:
+        with open(fn, 'rb') as f:
+            valid = f.read(4) == b'root'
+    except OSError:
+        sys.stderr.write("'{}' is not a readable file.\n".format(fn))
+        return False
+
+    if not valid:
+        sys.stderr.write("'{}' is not a root file.\n".format(fn))
 
     return valid
 
+# Validate a pitch angle file by parsing its first line, which must hold two
+# numbers (time and pitch angle). An empty file has no events and is valid.
+def validate_pitch(fn):
+    try:
+        with open(fn, 'r') as f:
+            line = f.readline()
+    except (OSError, UnicodeDecodeError):
+        sys.stderr.write("'{}' is not a readable text file.\n".format(fn))
+        return False
+
+    if not line.strip():
+        return True
+
+    try:
+        time, pitch_angle = (float(value) for value in line.split())
+    except ValueError:
+        sys.stderr.write("'{}' is not a pitch angle file.\n".format(fn))
+        return False
+
+    return True
+
+# The validation method of each kind of file found by index_seeds
+VALIDATORS = {'h5': validate_hdf5, 'root': validate_root, 'pitch': validate_pitch}
+
 if __name__ == "__main__":
     # check_assumptions()
     seeds, files, data = process_files(test=True)
\ No newline at end of file
@@ -0,0 +1,290 @@
+"""
+Single pass reducers for the per seed records yielded by process.iter_seeds.
+Every reducer keeps running totals (at most a few numbers per seed) rather than
+the seed data, so sweeping thousands of seeds never holds more than one seed.
+
+i.e.)
+    counts = EventCounts()
+    times = Histogram(['candidates', 'candidates_0_', 'StartTimeInAcq_'], np.arange(0, 0.02, 0.025e-3))
+    reduce_seeds(iter_seeds(), counts, times)
+"""
+
+import sys
+
+import numpy as np
+
+# Feeds every (seed, files, seed_data) record to each of the reducers and returns them
+def reduce_seeds(records, *reducers):
+    for seed, __, seed_data in records:
+        for reducer in reducers:
+            reducer.update(seed, seed_data)
+
+    return reducers
+
+# Follows a list of keys down a seed dictionary. A structured array is indexed by
+# field name the same way a dictionary is indexed by key.
+def fetch(seed_data, keys):
+    value = seed_data
+    for key in keys:
+        value = value[key]
+
+    return value
+
+class EventCounts():
+    """
+        Summary: Counts the simulated events (pitch times), the events Katydid detected
+                    (candidates) and the detected events matched to a simulated one.
+
+        Attributes:
+            seeds: A list of the seeds seen
+            simulated, detected, matched: Lists of the per seed counts (same order as seeds)
+    """
+    def __init__(self):
+        self.seeds = list()
+        self.simulated = list()
+        self.detected = list()
+        self.matched = list()
+
+    def update(self, seed, seed_data):
+        self.seeds.append(seed)
+        self.simulated.append(len(seed_data['pitch times']))
+        self.detected.append(len(seed_data['candidates']['candidates_0']))
+        self.matched.append(len(seed_data['candidates']['candidates_0_']))
+
+    # Returns the totals as a dictionary of simulated, detected and matched
+    def totals(self):
+        return {'simulated': int(np.sum(self.simulated)),
+                'detected': int(np.sum(self.detected)),
+                'matched': int(np.sum(self.matched))}
+
+    # Returns the detection and match efficiencies (fraction of simulated events)
+    def efficiency(self):
+        totals = self.totals()
+        if totals['simulated'] == 0:
+            return {'detected': np.nan, 'matched': np.nan}
+
+        return {'detected': totals['detected'] / totals['simulated'],
+                'matched': totals['matched'] / totals['simulated']}
+
+class Axis():
+    """
+        Summary: The bin edges of one histogram axis. The edges are either fixed or
+                    auto-calibrated: bins of a fixed width laid from an origin which
+                    grow to cover whatever values arrive.
+
+        Attributes:
+            fixed: The fixed bin edges (None when auto-calibrated)
+            binwidth, origin: The bin width and the position of one edge (auto-calibrated)
+            start: The index (counted in bin widths from origin) of the first bin (auto-calibrated)
+            nbins: The number of bins
+    """
+    def __init__(self, edges=None, binwidth=None, origin=0.0):
+        if edges is not None:
+            edges = np.asarray(edges, dtype=float)
+            if edges.ndim != 1 or edges.size < 2:
+                sys.exit('Histogram Error: edges must be a one dimensional array of at least 2 values.')
+        elif binwidth is None or binwidth <= 0:
+            sys.exit('Histogram Error: either edges or a positive binwidth must be given.')
+
+        self.fixed = edges
+        self.binwidth = binwidth
+        self.origin = origin
+        self.start = 0
+        self.nbins = edges.size - 1 if edges is not None else 0
+
+    @property
+    def edges(self):
+        if self.fixed is not None:
+            return self.fixed
+
+        return self.origin + self.binwidth * np.arange(self.start, self.start + self.nbins + 1)
+
+    # Returns the bin of every value (below 0 or from nbins up when outside fixed edges)
+    # and the (before, after) number of bins an auto-calibrated axis grew to hold them
+    def bins(self, values):
+        if self.fixed is not None:
+            bins = np.searchsorted(self.fixed, values, side='right') - 1
+            # The last edge is inclusive as in np.histogram
+            bins[values == self.fixed[-1]] = self.nbins - 1
+
+            return (bins, (0, 0))
+
+        bins = np.floor((values - self.origin) / self.binwidth).astype(np.int64)
+        if bins.size == 0:
+            return (bins, (0, 0))
+
+        grown = self.cover(int(bins.min()), int(bins.max()) + 1)
+
+        return (bins - self.start, grown)
+
+    # Grows an auto-calibrated axis to cover the bins first:last (counted from origin)
+    #   Returns: (before, after) the number of bins added on either side
+    def cover(self, first, last):
+        if self.nbins == 0:
+            self.start, self.nbins = first, last - first
+            return (0, self.nbins)
+
+        before = max(self.start - first, 0)
+        after = max(last - (self.start + self.nbins), 0)
+
+        self.start -= before
+        self.nbins += before + after
+
+        return (before, after)
+
+    # Returns True if the other axis has the same kind of edges (so they can be merged)
+    def compatible(self, other):
+        if self.fixed is not None or other.fixed is not None:
+            return self.fixed is not None and other.fixed is not None and np.array_equal(self.fixed, other.fixed)
+
+        return self.binwidth == other.binwidth and self.origin == other.origin
+
+class Binned():
+    """
+        Summary: The counts of a histogram over one or more axes. Only the counts are ever
+                    kept so a histogram of any number of seeds takes constant memory, and
+                    histograms filled by different workers are combined with merge.
+
+        Attributes:
+            axes: A list of Axis objects (one per dimension)
+            counts: The counts in every bin (one dimension per axis)
+            outside: The number of values outside the fixed edges of any axis or infinite
+    """
+    def __init__(self, axes):
+        self.axes = axes
+        self.counts = np.zeros([axis.nbins for axis in axes], dtype=np.int64)
+        self.outside = 0
+
+    # Bins one array of values per axis (all of the same length). NaN values are
+    # dropped and infinite ones counted as outside (they have no bin to grow to).
+    def _fill(self, *values):
+        values = [np.asarray(value, dtype=float).ravel() for value in values]
+
+        valid = np.logical_and.reduce([~np.isnan(value) for value in values])
+        finite = np.logical_and.reduce([np.isfinite(value) for value in values])
+        values = [value[finite] for value in values]
+        self.outside += int(np.count_nonzero(valid & ~finite))
+
+        bins = list()
+        grown = list()
+        for axis, value in zip(self.axes, values):
+            axis_bins, pad = axis.bins(value)
+            bins.append(axis_bins)
+            grown.append(pad)
+
+        self.counts = np.pad(self.counts, grown)
+
+        inside = np.logical_and.reduce([(b >= 0) & (b < axis.nbins) for b, axis in zip(bins, self.axes)])
+        flat = np.ravel_multi_index([b[inside] for b in bins], self.counts.shape)
+
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        self.outside += int(inside.size - np.count_nonzero(inside))
+
+        return bins
+
+    # Adds the counts of another histogram with compatible edges (i.e. from another worker)
+    def merge(self, other):
+        if len(self.axes) != len(other.axes) or not all(a.compatible(b) for a, b in zip(self.axes, other.axes)):
+            sys.exit('Histogram Error: cannot merge histograms with different edges.')
+
+        grown = list()
+        for axis, theirs in zip(self.axes, other.axes):
+            if axis.fixed is None and theirs.nbins:
+                grown.append(axis.cover(theirs.start, theirs.start + theirs.nbins))
+            else:
+                grown.append((0, 0))
+
+        self.counts = np.pad(self.counts, grown)
+
+        region = tuple(slice(theirs.start - axis.start, theirs.start - axis.start + theirs.nbins)
+                       for axis, theirs in zip(self.axes, other.axes))
+        self.counts[region] += other.counts
+        self.outside += other.outside
+
+        return self
+
+class Histogram(Binned):
+    """
+        Summary: A histogram filled one seed at a time. The bin edges are either fixed or
+                    auto-calibrated from a bin width (bins laid from origin which grow to
+                    cover the values).
+
+        Attributes:
+            keys: The keys leading to the values in a seed dictionary
+                    (i.e. ['candidate_tracks', 'candidate_tracks_0', 'StartFrequency'])
+            edges: The bin edges
+            scale: A factor applied to every value before binning (i.e. 1e-6 for Hz to MHz)
+            counts: The counts in every bin
+            underflow, overflow: The number of values below or above fixed edges (or -inf and inf)
+    """
+    def __init__(self, keys, edges=None, scale=1.0, binwidth=None, origin=0.0):
+        Binned.__init__(self, [Axis(edges, binwidth, origin)])
+
+        self.keys = keys
+        self.scale = scale
+        self.underflow = 0
+        self.overflow = 0
+
+    @property
+    def edges(self):
+        return self.axes[0].edges
+
+    def update(self, seed, seed_data):
+        self.fill(fetch(seed_data, self.keys))
+
+    # Adds the values (before scaling) to the histogram
+    def fill(self, values):
+        values = np.asarray(values, dtype=float) * self.scale
+        bins, = self._fill(values)
+
+        self.underflow += int(np.count_nonzero(bins < 0)) + int(np.count_nonzero(values == -np.inf))
+        self.overflow += int(np.count_nonzero(bins >= self.axes[0].nbins)) + int(np.count_nonzero(values == np.inf))
+
+        return self
+
+    def merge(self, other):
+        Binned.merge(self, other)
+
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+
+        return self
+
+class Histogram2D(Binned):
+    """
+        Summary: A two dimensional histogram filled one seed at a time. Each axis has
+                    fixed or auto-calibrated edges as in Histogram.
+
+        Attributes:
+            xkeys, ykeys: The keys leading to the x and y values in a seed dictionary
+                    (the values of a seed must be the same length)
+            xedges, yedges: The bin edges of either axis
+            xscale, yscale: Factors applied to the x and y values before binning
+            counts: The counts in every (x, y) bin
+            outside: The number of (x, y) pairs outside fixed edges
+    """
+    def __init__(self, xkeys, ykeys, xedges=None, yedges=None, xscale=1.0, yscale=1.0,
+                 xbinwidth=None, ybinwidth=None, xorigin=0.0, yorigin=0.0):
+        Binned.__init__(self, [Axis(xedges, xbinwidth, xorigin), Axis(yedges, ybinwidth, yorigin)])
+
+        self.xkeys = xkeys
+        self.ykeys = ykeys
+        self.xscale = xscale
+        self.yscale = yscale
+
+    @property
+    def xedges(self):
+        return self.axes[0].edges
+
+    @property
+    def yedges(self):
+        return self.axes[1].edges
+
+    def update(self, seed, seed_data):
+        self.fill(fetch(seed_data, self.xkeys), fetch(seed_data, self.ykeys))
+
+    # Adds the (x, y) values (before scaling) to the histogram
+    def fill(self, x, y):
+        self._fill(np.asarray(x, dtype=float) * self.xscale, np.asarray(y, dtype=float) * self.yscale)
+
+        return self
@@ -0,0 +1,152 @@
+"""
+One-time conversion of the Katydid ROOT outputs of a seed (SeedXXX.root) into a compact
+hdf5 sidecar (SeedXXX.sparse.h5 next to it) so that plotting and efficiency checks never
+need PyROOT (or one GetEntry call per point) once a file has been converted.
+
+Layout of a sidecar file (group, dataset, fields), the fields are named after the ROOT
+leaves without their leading 'f' as in the Katydid hdf5 outputs:
+    DISCRIM: discPoints1D/discPoints1D_0 with TimeInRunC and Abscissa of every discriminated point
+    TRACKS: tracks/tracks_0 with EventID, StartTimeInRunC, EndTimeInRunC, StartFrequency and
+        EndFrequency of every track of every multi track event
+    EVENTS: candidates/candidates_0 with EventID, StartTimeInRunC and StartFrequency of every
+        multi track event
+
+The root file's (mtime_ns, size) is stored in the 'source' attribute and a sidecar is only
+used while it matches (see is_fresh).
+"""
+
+from __future__ import division
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+
+import numpy as np
+
+SIDECAR_EXTENSION = '.sparse.h5'
+
+DISCRIM = ('discPoints1D', 'discPoints1D_0', ['TimeInRunC', 'Abscissa'])
+TRACKS = ('tracks', 'tracks_0', ['StartTimeInRunC', 'EndTimeInRunC', 'StartFrequency', 'EndFrequency'])
+EVENTS = ('candidates', 'candidates_0', ['StartTimeInRunC', 'StartFrequency'])
+
+# Returns the sidecar file name of a root file
+def sidecar_name(root_file):
+    return os.path.splitext(root_file)[0] + SIDECAR_EXTENSION
+
+# Returns True if the sidecar of the root file exists and was converted from its current contents
+def is_fresh(root_file):
+    import h5py
+    from seedcache import fingerprint
+
+    sidecar = sidecar_name(root_file)
+    if not os.path.isfile(sidecar):
+        return False
+
+    try:
+        with h5py.File(sidecar, 'r') as sf:
+            source = tuple(sf.attrs.get('source', ()))
+    except (IOError, OSError):
+        return False
+
+    return source == fingerprint(root_file)
+
+"""
+Converts the discPoints1D and multiTrackEvents trees of a root file into its sidecar (needs PyROOT
+unless the sidecar is already fresh, which is returned as it is)
+    root_file: The path of the root file
+    force [default: False]: Convert even if the sidecar is fresh
+
+    Returns: The sidecar file name or None if the root file has no discPoints1D tree
+"""
+def convert_root(root_file, force=False):
+    from seedcache import fingerprint, replacing
+
+    sidecar = sidecar_name(root_file)
+    if not force and is_fresh(root_file):
+        return sidecar
+
+    import ROOT # only need ROOT for the conversion
+
+    source = fingerprint(root_file)
+    rf = ROOT.TFile(root_file)
+
+    disc = rf.Get('discPoints1D')
+    if not disc:
+        sys.stderr.write("'{}' has no discPoints1D tree.\n".format(root_file))
+        rf.Close()
+        return None
+
+    points = np.zeros(disc.GetEntries(), dtype=[(field, float) for field in DISCRIM[2]])
+    for i in range(points.size):
+        disc.GetEntry(i)
+        points[i] = (disc.fTimeInRunC, disc.fAbscissa)
+
+    events = list()
+    tracks = list()
+
+    mtevents = rf.Get('multiTrackEvents')
+    if mtevents:
+        # Leaves are looked up once, GetEntry refills them for every event
+        event_leaves = [mtevents.FindLeaf('f' + field) for field in EVENTS[2]]
+        track_leaves = [mtevents.FindLeaf('fTracks.f' + field) for field in TRACKS[2]]
+
+        for i in range(mtevents.GetEntries()):
+            mtevents.GetEntry(i)
+            events.append((i,) + tuple(leaf.GetValue() for leaf in event_leaves))
+
+            for j in range(track_leaves[0].GetLen()):
+                tracks.append((i,) + tuple(leaf.GetValue(j) for leaf in track_leaves))
+
+    rf.Close()
+
+    events = np.array(events, dtype=[('EventID', np.uint32)] + [(field, float) for field in EVENTS[2]])
+    tracks = np.array(tracks, dtype=[('EventID', np.uint32)] + [(field, float) for field in TRACKS[2]])
+
+    with replacing(sidecar) as sf:
+        for (group, dataset, __), values in ((DISCRIM, points), (TRACKS, tracks), (EVENTS, events)):
+            sf.create_dataset(group + '/' + dataset, data=values)
+
+        sf.attrs['source'] = np.array(source, dtype=np.int64)
+
+    return sidecar
+
+# Converts every root file in a directory whose sidecar is missing or stale
+#   Returns: The list of sidecar file names which were written
+def convert_dir(root_dir, force=False):
+    converted = list()
+    for fn in sorted(os.listdir(root_dir)):
+        root_file = os.path.join(root_dir, fn)
+
+        if fn.endswith('.root') and (force or not is_fresh(root_file)):
+            sidecar = convert_root(root_file, force=True)
+
+            if sidecar is not None:
+                converted.append(sidecar)
+
+    return converted
+
+# Returns the number of multi track events recorded in a fresh sidecar (converting the root
+# file first if needed) or -1 if there is none and it cannot be converted
+def count_events(root_file):
+    import h5py
+
+    if not is_fresh(root_file):
+        try:
+            sidecar = convert_root(root_file)
+        except ImportError:
+            sys.stderr.write("'{}' has no fresh sidecar and PyROOT is not available to convert it.\n".format(root_file))
+            return -1
+
+        if sidecar is None:
+            return -1
+
+    group, dataset, __ = EVENTS
+    with h5py.File(sidecar_name(root_file), 'r') as sf:
+        return sf[group + '/' + dataset].shape[0]
+
+if __name__ == "__main__":
+    root_dir = sys.argv[1] if len(sys.argv) > 1 else "./data/processed_eggs/root"
+
+    converted = convert_dir(root_dir)
+    print("Converted {} root file(s) in {}.".format(len(converted), root_dir))
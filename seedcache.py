@@ -0,0 +1,292 @@
+"""
+Packs the h5 and pitch angle files of many seeds into a single chunked columnar
+hdf5 file so an analysis opens one file and does a few large sequential reads
+instead of opening hundreds of small seed files.
+
+Layout of the cache file:
+    seeds: The seed names (i.e. b'Seed100') in the order they were packed
+    fingerprints: (mtime_ns, size) of the h5 file and the pitch file for every seed
+    tables/<group>/<dataset>/...: One table per dataset found in the seed files
+        columns/<field>: The concatenated values of a compound field (or 'values'
+            for a plain dataset) for every seed
+        seed_id: The index into seeds of every row
+        offsets: Rows offsets[i]:offsets[i + 1] belong to seeds[i]
+        shapes: The original shape of the dataset for every seed
+        present: False for seeds whose file did not have the dataset
+    pitch/...: The pitch times and pitch angles as a table with the same index
+
+A seed is stale when the fingerprint of either of its source files changes and
+only stale (or new) seeds are read from the source files when the cache is rebuilt.
+"""
+
+import os
+import sys
+
+from contextlib import contextmanager
+
+import h5py as h5
+import numpy as np
+
+PITCH_TABLE = 'pitch'
+PITCH_COLUMNS = {'times': 'pitch times', 'angles': 'pitch angles'}
+
+# Returns (mtime_ns, size) of the file or (-1, -1) if it does not exist
+def fingerprint(fn):
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return (-1, -1)
+
+    return (st.st_mtime_ns, st.st_size)
+
+# Parses a pitch angle file into an (N, 2) array of (time, pitch angle) rows. The
+# whole file is split at once and converted by numpy rather than line by line.
+def parse_pitch_file(fn):
+    with open(fn, 'r') as f:
+        values = np.array(f.read().split(), dtype=float)
+
+    if values.size % 2:
+        sys.exit("Error: '{}' must have two columns (time, pitch angle).".format(fn))
+
+    return values.reshape(-1, 2)
+
+# Opens a new hdf5 file for writing next to fn and swaps it in for fn once the block
+# is done so readers never see half a file
+@contextmanager
+def replacing(fn):
+    tmp_fn = fn + '.tmp'
+    with h5.File(tmp_fn, 'w') as hf:
+        yield hf
+
+    os.replace(tmp_fn, fn)
+
+# Returns the fingerprint row stored in the cache for a (h5_file, pitch_file) pair
+def _fingerprints(h5_file, pitch_file):
+    return fingerprint(h5_file) + fingerprint(pitch_file)
+
+# Returns a dictionary of seed -> fingerprint row for every seed in the cache file
+def _cached_fingerprints(cache_fn):
+    if not os.path.isfile(cache_fn):
+        return dict()
+
+    with h5.File(cache_fn, 'r') as cf:
+        return dict(zip(_decode(cf['seeds'][()]), map(tuple, cf['fingerprints'][()].tolist())))
+
+# Returns the seeds (from the given seeds and files) whose cached copy is still fresh
+def fresh_seeds(cache_fn, seeds, files):
+    cached = _cached_fingerprints(cache_fn)
+
+    fresh = list()
+    for seed, (h5_file, pitch_file) in zip(seeds, files):
+        if cached.get(seed) == _fingerprints(h5_file, pitch_file):
+            fresh.append(seed)
+
+    return fresh
+
+"""
+Builds (or updates) the cache file for the given seeds.
+    cache_fn: The path of the cache file
+    seeds: A list of seed names (i.e. ['Seed100', 'Seed110'])
+    files: A list of tuples of (h5_file, pitch_file) matching seeds
+
+    Seeds which are fresh in the existing cache are copied from it, every other
+    seed is read from its source files. Seeds in the cache but not in seeds are
+    dropped. Nothing is written if every seed is already fresh.
+
+    Returns: The list of seeds which were read from the source files
+"""
+def build_cache(cache_fn, seeds, files):
+    fresh = fresh_seeds(cache_fn, seeds, files)
+
+    stale = [seed for seed in seeds if seed not in fresh]
+    if not stale and list(_cached_fingerprints(cache_fn)) == list(seeds):
+        return stale
+
+    data = dict()
+    for seed, seed_data in load_cache(cache_fn, fresh).items():
+        data[seed] = _flatten(seed_data)
+
+    for seed in stale:
+        h5_file, pitch_file = files[seeds.index(seed)]
+
+        with h5.File(h5_file, 'r') as hf:
+            seed_data = _read_datasets(hf)
+
+        pitch = parse_pitch_file(pitch_file)
+        seed_data[PITCH_COLUMNS['times']] = pitch[:, 0]
+        seed_data[PITCH_COLUMNS['angles']] = pitch[:, 1]
+
+        data[seed] = seed_data
+
+    with replacing(cache_fn) as cf:
+        cf['seeds'] = np.array([seed.encode() for seed in seeds], dtype='S')
+        cf['fingerprints'] = np.array([_fingerprints(*fls) for fls in files], dtype=np.int64).reshape(-1, 4)
+
+        paths = sorted(set(path for seed in seeds for path in data[seed] if path not in PITCH_COLUMNS.values()))
+        for path in paths:
+            _write_table(cf.create_group('tables/' + path), [data[seed].get(path) for seed in seeds])
+
+        pitch = cf.create_group(PITCH_TABLE)
+        _write_table(pitch, [_pitch_record(data[seed]) for seed in seeds])
+
+    return stale
+
+"""
+Loads the given seeds out of the cache file.
+    cache_fn: The path of the cache file
+    seeds: A list of seed names to load
+    files [default: None]: A list of tuples of (h5_file, pitch_file) matching seeds.
+        If given only seeds that are fresh with respect to these files are loaded.
+
+    Returns: A dictionary keyed by seed in the same form as h5todict(..., lazy=False)
+        with 'pitch times' and 'pitch angles' added to each seed
+"""
+def load_cache(cache_fn, seeds, files=None):
+    if files is not None:
+        seeds = fresh_seeds(cache_fn, seeds, files)
+
+    data = dict((seed, dict()) for seed in seeds)
+    if not seeds:
+        return data
+
+    with h5.File(cache_fn, 'r') as cf:
+        index = dict((seed, i) for i, seed in enumerate(_decode(cf['seeds'][()])))
+        missing = [seed for seed in seeds if seed not in index]
+        if missing:
+            sys.exit("Error: {} not found in the cache '{}'.".format(missing, cache_fn))
+
+        rows = [index[seed] for seed in seeds]
+
+        tables = list()
+        cf['tables'].visititems(lambda name, obj: tables.append(name) if isinstance(obj, h5.Group) and 'offsets' in obj else None)
+
+        for path in tables:
+            for seed, value in zip(seeds, _read_table(cf['tables/' + path], rows)):
+                if value is not None:
+                    _insert(data[seed], path, value)
+
+        for seed, record in zip(seeds, _read_table(cf[PITCH_TABLE], rows)):
+            for column, key in PITCH_COLUMNS.items():
+                data[seed][key] = record[column]
+
+    return data
+
+# Returns the pitch columns of a seed as a compound array
+def _pitch_record(seed_data):
+    times = seed_data[PITCH_COLUMNS['times']]
+    record = np.zeros(len(times), dtype=[(column, float) for column in PITCH_COLUMNS])
+    for column, key in PITCH_COLUMNS.items():
+        record[column] = seed_data[key]
+
+    return record
+
+# Reads every dataset of an open hdf5 file into a flat dictionary keyed by path
+def _read_datasets(hf):
+    datasets = dict()
+    hf.visititems(lambda name, obj: datasets.update({name: np.array(obj)}) if isinstance(obj, h5.Dataset) else None)
+
+    return datasets
+
+# Writes one table: the concatenated columns of a dataset for every seed plus its index
+def _write_table(grp, values):
+    present = np.array([value is not None for value in values])
+    values = [np.asarray(value) for value in values if value is not None]
+
+    sizes = np.zeros(present.size, dtype=np.int64)
+    sizes[present] = [value.size for value in values]
+
+    shapes = np.zeros((present.size, values[0].ndim), dtype=np.int64)
+    shapes[present] = np.array([value.shape for value in values], dtype=np.int64).reshape(len(values), -1)
+
+    grp['present'] = present
+    grp['offsets'] = np.concatenate(([0], np.cumsum(sizes)))
+    grp['seed_id'] = np.repeat(np.arange(present.size, dtype=np.int32), sizes)
+    grp['shapes'] = shapes
+
+    names = values[0].dtype.names
+    grp.attrs['fields'] = np.array(names if names else [], dtype='S')
+
+    columns = grp.create_group('columns')
+    for name in (names or ('values',)):
+        column = np.concatenate([(value[name] if names else value).ravel() for value in values])
+        columns.create_dataset(name, data=column, chunks=True if column.size else None)
+
+# Reads the rows of the given seeds (by index) out of a table. Only the rows of
+# those seeds are read: seeds next to each other in the table are read together
+# in one slice of every column (so loading every seed is one read per column).
+# Returns one array per seed (None if not present).
+def _read_table(grp, rows):
+    present = grp['present'][()]
+    offsets = grp['offsets'][()]
+    shapes = grp['shapes'][()]
+    fields = _decode(grp.attrs['fields'])
+
+    # Split the seeds into runs of consecutive rows and read the span of every run
+    wanted = np.unique(rows)
+    runs = np.split(wanted, np.flatnonzero(np.diff(wanted) != 1) + 1) if wanted.size else []
+
+    spans = dict()
+    for run in runs:
+        first, last = offsets[run[0]], offsets[run[-1] + 1]
+        columns = dict((name, col[first:last]) for name, col in grp['columns'].items())
+
+        for row in run:
+            spans[row] = (columns, offsets[row] - first, offsets[row + 1] - first)
+
+    dt = np.dtype([(name, grp['columns'][name].dtype) for name in fields]) if fields else None
+
+    values = list()
+    for row in rows:
+        if not present[row]:
+            values.append(None)
+            continue
+
+        columns, beg, end = spans[row]
+        shape = tuple(shapes[row])
+        if fields:
+            value = np.empty(end - beg, dtype=dt)
+            for name in fields:
+                value[name] = columns[name][beg:end]
+        else:
+            value = columns['values'][beg:end]
+
+        values.append(value.reshape(shape))
+
+    return values
+
+# Turns a nested seed dictionary back into a flat dictionary keyed by path
+def _flatten(seed_data, prefix=''):
+    flat = dict()
+    for name, value in seed_data.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix + name + '/'))
+        else:
+            flat[prefix + name] = value
+
+    return flat
+
+# Places a value at the group/dataset path of a nested dictionary
+def _insert(seed_data, path, value):
+    *groups, name = path.split('/')
+    for group in groups:
+        seed_data = seed_data.setdefault(group, dict())
+
+    seed_data[name] = value
+
+def _decode(names):
+    return [name.decode() if isinstance(name, bytes) else str(name) for name in names]
+
+if __name__ == "__main__":
+    from process import extract_dirSeeds
+
+    cache_fn = sys.argv[1] if len(sys.argv) > 1 else "./data/seed_cache.h5"
+
+    h5_dir = "./data/processed_eggs/hdf5"
+    pitch_angle_dir = "./data/pitch_angles"
+
+    seeds = sorted(set(extract_dirSeeds(h5_dir)) & set(extract_dirSeeds(pitch_angle_dir)))
+    files = [(os.path.join(h5_dir, "{}.h5".format(seed)),
+              os.path.join(pitch_angle_dir, "pitchangles_{}.txt".format(seed))) for seed in seeds]
+
+    stale = build_cache(cache_fn, seeds, files)
+    print("Packed {} seeds into {} ({} read from source).".format(len(seeds), cache_fn, len(stale)))
@@ -0,0 +1,217 @@
+"""
+A persistent record of the results derived from every seed so a re-run only has
+to process the seeds which are new or whose source files changed.
+
+Layout of the manifest file (hdf5):
+    <seed>: One group per seed with the attributes
+            fingerprints: (mtime_ns, size) of the h5 file and the pitch file
+            simulated / detected: Event counts used by test_event_processing
+        and one dataset per stored result keyed by its path in the data dictionary
+        (i.e. 'pitch times_' or 'candidates/candidates_0_')
+
+The file carries MANIFEST_MARKER in its 'format' attribute. A manifest whose version
+differs from MANIFEST_VERSION (which must be bumped whenever the standard filters
+change what they produce) is replaced by an empty one, and any other existing file
+at the path is refused rather than overwritten.
+"""
+
+import os
+import sys
+
+from contextlib import contextmanager
+
+import h5py as h5
+import numpy as np
+
+from seedcache import _fingerprints, replacing
+
+MANIFEST_MARKER = 'seedmanifest'
+MANIFEST_VERSION = 1
+
+# Results of the standard filters (and the raw pitch data) kept for every seed
+RESULTS = ['pitch times', 'pitch angles', 'pitch times_', 'pitch angles_',
+           'egg indices', 'pitch indices', 'candidates/candidates_0_']
+
+class SeedManifest():
+    """
+        Summary: Reads and writes the per seed manifest file. A seed's entries are only
+                    returned while the fingerprints of its source files are unchanged and
+                    they are wiped as soon as a changed seed is recorded again.
+
+                    Every call opens and closes the file unless it is used in a with
+                    block, which keeps the file open until the block is left
+                    (i.e. for looking up or recording many seeds).
+
+        Attributes:
+            filename: The path of the manifest file
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._mf = None
+        self._depth = 0
+
+        if os.path.exists(filename):
+            try:
+                with h5.File(filename, 'r') as mf:
+                    marker = mf.attrs.get('format')
+                    version = mf.attrs.get('version')
+            except OSError:
+                sys.exit("SeedManifest Error: '{}' is not an hdf5 file.".format(filename))
+
+            if isinstance(marker, bytes):
+                marker = marker.decode()
+
+            if marker != MANIFEST_MARKER:
+                sys.exit("SeedManifest Error: '{}' is not a seed manifest.".format(filename))
+
+            if version != MANIFEST_VERSION:
+                with replacing(filename) as mf:
+                    self._stamp(mf)
+
+    def __enter__(self):
+        if self._depth == 0:
+            self._mf = self._open('a')
+        self._depth += 1
+
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            self._mf.close()
+            self._mf = None
+
+    # Returns the open manifest file (created if needed) in the given mode
+    def _open(self, mode='r'):
+        if mode == 'r' and not os.path.isfile(self.filename):
+            return None
+
+        mf = h5.File(self.filename, mode)
+        if mode != 'r' and 'format' not in mf.attrs:
+            self._stamp(mf)
+
+        return mf
+
+    # Marks an open file as a manifest of the current version
+    @staticmethod
+    def _stamp(mf):
+        mf.attrs['format'] = MANIFEST_MARKER
+        mf.attrs['version'] = MANIFEST_VERSION
+
+    # Yields the manifest file held open by a with block, or opens it for the
+    # duration of a single call (None if it does not exist and mode is 'r')
+    @contextmanager
+    def _file(self, mode='r'):
+        if self._mf is not None:
+            yield self._mf
+            return
+
+        mf = self._open(mode)
+        if mf is None:
+            yield None
+            return
+
+        with mf:
+            yield mf
+
+    # Returns the seed group if it is fresh with respect to the files else None
+    @staticmethod
+    def _fresh_group(mf, seed, files):
+        grp = mf.get(seed)
+        if grp is None:
+            return None
+
+        if tuple(grp.attrs['fingerprints'].tolist()) != _fingerprints(*files):
+            return None
+
+        return grp
+
+    # Returns True if every one of the names is stored and fresh for the seed
+    def is_fresh(self, seed, files, names=RESULTS):
+        with self._file() as mf:
+            if mf is None:
+                return False
+
+            grp = self._fresh_group(mf, seed, files)
+
+            return grp is not None and all(name in grp or name in grp.attrs for name in names)
+
+    """
+    Returns a dictionary of the stored entries for the seed or None if the seed is
+    not fresh or any of the names are missing.
+        seed: The seed name (i.e. 'Seed100')
+        files: The (h5_file, pitch_file) tuple the entries were derived from
+        names [default: RESULTS]: The datasets or attributes to return
+    """
+    def get(self, seed, files, names=RESULTS):
+        with self._file() as mf:
+            if mf is None:
+                return None
+
+            grp = self._fresh_group(mf, seed, files)
+            if grp is None:
+                return None
+
+            entries = dict()
+            for name in names:
+                if name in grp.attrs:
+                    entries[name] = grp.attrs[name]
+                elif name in grp:
+                    entries[name] = grp[name][()]
+                else:
+                    return None
+
+        return entries
+
+    """
+    Records entries for the seed. Entries from the same source files are kept and
+    everything stored for the seed is dropped if the source files have changed.
+        seed: The seed name (i.e. 'Seed100')
+        files: The (h5_file, pitch_file) tuple the entries were derived from
+        entries: A dictionary of name -> value. Scalars are stored as attributes and
+            everything else as datasets.
+    """
+    def record(self, seed, files, entries):
+        with self._file('a') as mf:
+            if self._fresh_group(mf, seed, files) is None and seed in mf:
+                del mf[seed]
+
+            grp = mf.require_group(seed)
+            grp.attrs['fingerprints'] = np.array(_fingerprints(*files), dtype=np.int64)
+
+            for name, value in entries.items():
+                if name in grp:
+                    del grp[name]
+
+                if np.isscalar(value):
+                    grp.attrs[name] = value
+                else:
+                    grp[name] = np.asarray(value)
+
+    # Returns the stored results of the standard filters of a filtered seed dictionary
+    @staticmethod
+    def results(seed_data):
+        entries = dict()
+        for name in RESULTS:
+            value = seed_data
+            for key in name.split('/'):
+                value = value[key]
+            entries[name] = value
+
+        entries['simulated'] = len(seed_data['pitch times'])
+        entries['detected'] = len(seed_data['candidates']['candidates_0'])
+
+        return entries
+
+    # Places stored results back into a seed dictionary (i.e. from h5todict)
+    @staticmethod
+    def restore(seed_data, entries):
+        for name in RESULTS:
+            *groups, key = name.split('/')
+
+            value = seed_data
+            for group in groups:
+                value = value[group]
+            value[key] = entries[name]
+
+        return seed_data
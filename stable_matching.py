@@ -1,116 +1,126 @@
 import sys
-import numpy as np
+from collections import deque
 
-class PreferenceMatrix():
-    """
-    Summary: ??? This is pretty broken at the moment
+import numpy as np
 
-    Attributes:
-        preferences: A python dictionary of ElementArray objects containing the preferences
+from coincidences import band_pairs
 
+class StableMatching():
     """
-    def __init__(self, keys, prefs):
-
-        # Check that keys is the correct instance
-        if not isinstance(keys, ElementArray):
-            sys.exit('PreferenceMatrix Error: keys must be an ElementArray')
-
-        # Check the lengths of the keys and preferences
-        if len(keys.values) != len(prefs):
-            sys.exit('PreferenceMatrix Error: keys and prefs must be same length')
-        else:
-            number_preferences = len(keys.values)
+        Summary: The Gale-Shapley stable matching algorithm with every participant held in
+                    integer numpy arrays. Proposers and acceptors are referred to by index and
+                    each proposer's preference list is stored in compressed rows, best first.
+                    The rank an acceptor gives a proposer is stored next to the proposer's entry
+                    so every comparison an acceptor makes is a single array lookup.
 
-        self.preferences = dict()
+        Attributes:
+            offsets: Proposer p's preferences are entries offsets[p]:offsets[p + 1]
+            choices: The acceptor of every entry
+            ranks: The rank the acceptor of every entry gives its proposer (lower is preferred)
+            next: The entry every proposer will propose to next
+            partner: The acceptor matched to every proposer (-1 if unmatched)
+            suitor: The proposer held by every acceptor (-1 if unmatched)
+            suitor_rank: The rank of the proposer held by every acceptor
+    """
+    def __init__(self, offsets, choices, ranks, n_acceptors):
+        offsets = np.asarray(offsets, dtype=np.intp)
+        choices = np.asarray(choices, dtype=np.intp)
+        ranks = np.asarray(ranks, dtype=np.intp)
+
+        if offsets.ndim != 1 or offsets.size < 1 or offsets[-1] != choices.size:
+            sys.exit('StableMatching Error: offsets must end at the number of choices.')
+
+        if choices.shape != ranks.shape:
+            sys.exit('StableMatching Error: choices and ranks must be the same length.')
+
+        self.offsets = offsets
+        self.choices = choices
+        self.ranks = ranks
+
+        self.next = offsets[:-1].copy()
+        self.partner = np.full(offsets.size - 1, -1, dtype=np.intp)
+        self.suitor = np.full(n_acceptors, -1, dtype=np.intp)
+        self.suitor_rank = np.full(n_acceptors, np.iinfo(np.intp).max, dtype=np.intp)
+
+    # Runs the proposals until every proposer is matched or has exhausted its preferences
+    def run(self):
+        offsets, choices, ranks = self.offsets, self.choices, self.ranks
+        nxt, partner, suitor, suitor_rank = self.next, self.partner, self.suitor, self.suitor_rank
+
+        queue = deque(np.flatnonzero(partner < 0).tolist())
+        while queue:
+            proposer = queue.popleft()
+
+            entry = nxt[proposer]
+            if entry == offsets[proposer + 1]:
+                continue
+            nxt[proposer] = entry + 1
+
+            acceptor = choices[entry]
+            rank = ranks[entry]
+            rival = suitor[acceptor]
+
+            if rank < suitor_rank[acceptor]:
+                # The acceptor trades up and its previous suitor proposes again
+                if rival >= 0:
+                    partner[rival] = -1
+                    queue.append(rival)
+
+                suitor[acceptor] = proposer
+                suitor_rank[acceptor] = rank
+                partner[proposer] = acceptor
+            else:
+                queue.append(proposer)
 
-        # Add all the keys and preferences into the appropriate
-        # bins of the dictionary
-        for pref_idx, key in enumerate(keys.values):
-            pref = ElementArray(prefs[pref_idx])
+        return self
 
-            self.preferences[key] = pref
+    # Returns (proposer_indices, acceptor_indices) of the matched pairs ordered by proposer
+    def pairs(self):
+        proposers = np.flatnonzero(self.partner >= 0)
 
-            # print('preferences[{}] = {}'.format(key.value, [element.value for element in pref.values]))
-            # print('proposed = {}'.format(pref.proposed))
+        return (proposers, self.partner[proposers])
 
-class Matches():
-    """
-        Summary: This is the workhorse of the stable matching algorithm. This stores all the pairs found
-                    during the algorithms run by using internal match and unmatch functions.
+"""
+Builds the preference lists of proposers and acceptors who prefer the partner closest
+in value. Only pairs closer than the tolerance are acceptable and ties go to the lower index.
+    proposers: One dimensional numpy array of values (i.e. egg times)
+    acceptors: One dimensional numpy array of values (i.e. pitch times)
+    tol: Largest difference allowed between a proposer and an acceptor
 
-        Attributes:
-            pairs: A list of pairs (proposer, acceptor) containing a tuple of Element objects.
+    Returns: (offsets, choices, ranks) as taken by StableMatching
+"""
+def preferences(proposers, acceptors, tol):
+    rows, cols, diffs = band_pairs(proposers, acceptors, tol).coo()
 
-    """
-    def __init__(self):
-        self.pairs = list()
-
-    # Match the two elements to one another if they have not already been matched
-    def match(self, proposer, acceptor):
-        # Check if the pair is already in the list of matches
-        if proposer.matched or acceptor.matched:
-            print('match error: {} or {} is already matched.'.format(proposer.value, acceptor.value))
-            return -1
-        else:
-            proposer.matched = True
-            acceptor.matched = True
-
-            pair = (proposer, acceptor)
-            self.pairs.append(pair)
-            # print('Matching ({}, {})'.format(pair[0].value, pair[1].value))
-
-    # Unmatch the proposer and acceptor from one another if they are both matched
-    # Problem: This doesn't check if they are necessarily matched together
-    def unmatch(self, proposer, acceptor):
-
-        if not (proposer.matched and acceptor.matched):
-            print('unmatch error: {} or {} is not matched.'.format(proposer.value, acceptor.value))
-            return -1
-        else:
-            proposer.matched = False
-            acceptor.matched = False
-
-            pair = (proposer, acceptor)
-            self.pairs.remove(pair)
-
-class ElementArray():
-    """
-        Summary: An object to store a list of Element object and hold the index of the most recently
-                    proposed to Element in the ElementArray.
+    return _ranked(rows, cols, diffs, len(proposers))
 
+# Sorts the acceptable (proposer, acceptor, difference) pairs into the proposers' rows
+# and ranks every pair from the acceptor's side
+def _ranked(rows, cols, diffs, n_proposers):
+    # Acceptor ranks: position of each pair within its acceptor ordered by difference
+    order = np.lexsort((rows, diffs, cols))
+    starts = np.searchsorted(cols[order], cols[order], side='left')
+    acpt_ranks = np.empty(order.size, dtype=np.intp)
+    acpt_ranks[order] = np.arange(order.size) - starts
 
-        Attributes:
-            elements: A one dimensional list of Element objects
-            proposed: An integer value to represent the index of last Element in the elements list
-                        which was proposed to.
-    """
-    def __init__(self, elements):
+    # Proposer rows: pairs grouped by proposer ordered by difference
+    order = np.lexsort((cols, diffs, rows))
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n_proposers))))
 
-        # Check to ensure the elements argument is a numpy array or list (which gets turned into a numpy array)
-        if not isinstance(elements, np.ndarray):
-            if isinstance(elements, list):
-                elements = np.array(elements)
-            else:
-                sys.exit('ElementArray Error: elements must be array like.')
+    return (offsets, cols[order], acpt_ranks[order])
 
-        # Initialize the elements list
-        self.elements = list()
-        for value in elements:
-            self.elements.append(Element(value))
+"""
+Stably matches proposers to acceptors by closeness of value within a tolerance
+    proposers: One dimensional numpy array of values (i.e. egg times)
+    acceptors: One dimensional numpy array of values (i.e. pitch times)
+    tol: Largest difference allowed between a matched proposer and acceptor
 
-        # Intialize the proposed value
-        self.proposed = 0
+    Returns: (proposer_indices, acceptor_indices) as numpy integer arrays ordered by proposer
+"""
+def stable_match(proposers, acceptors, tol):
+    if not isinstance(proposers, np.ndarray) or not isinstance(acceptors, np.ndarray):
+        sys.exit("Stable-Matching Error: proposers and acceptors must be numpy arrays.")
 
-class Element():
-    """
-        Description: This is a single component of a large object with stores multiple
-        data element to be matched together via preferences using the Gale-Shapely
-        stable matching algorithm.
+    offsets, choices, ranks = preferences(proposers, acceptors, tol)
 
-        Attributes:
-            value: The value of the element, can be string, int, float, etc
-            matched [False]: A boolean value to indicate if the element has been matched
-    """
-    def __init__(self, value):
-        self.value = value
-        self.matched = False
\ No newline at end of file
+    return StableMatching(offsets, choices, ranks, acceptors.size).run().pairs()